@@ -1,65 +1,193 @@
+import os
+
 import numpy as np
 import pygame as pg
 
-from config import config as cfg
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def load_font(fname, size):
+    """Load a font from file on first use, the font module is initialized only then."""
+    if not pg.font.get_init():
+        pg.font.init()
+
+    return pg.font.Font(os.path.join('assets', 'fonts', fname), size)
+
+
+@lru_cache(maxsize=None)
+def text_renderer(cache_size):
+    """Create the text renderer of a cache size on first use, with its own LRU cache."""
+    @lru_cache(maxsize=cache_size)
+    def render(font, text, color):
+        return load_font(*font).render(text, True, color)
+
+    return render
 
 
-class Vec2D(np.ndarray):
-    """Vector wrapper of numpy ndarray."""
-    def __new__(cls, input_array, x=0, y=0):
-        obj = np.asarray(input_array, dtype=np.int16).view(cls)
+def render_text(font, text, color, cfg):
+    """Render antialiased text in a (font family, font size) font, cached by font, text and color."""
+    return text_renderer(cfg.display.text_cache_size)(font, text, color)
 
-        obj.x = obj[0]
-        obj.y = obj[1]
+
+class Vec2D:
+    """Integer vector, a view on one row of an int16 array of vectors."""
+    __slots__ = ('array', 'index')
+
+    def __init__(self, input_array=(0, 0)):
+        """Initialize a vector backed by its own array."""
+        self.array = np.array(input_array, dtype=np.int16).reshape(1, 2)
+        self.index = 0
+
+
+    @classmethod
+    def bind(cls, array, index):
+        """Create a vector viewing a row of an existing array."""
+        obj = cls.__new__(cls)
+        obj.array = array
+        obj.index = index
 
         return obj
 
 
-    def __array_finalize__(self, obj):
-        """Finalize x and y attributes."""
-        if obj is None: 
-            return
+    @property
+    def x(self):
+        return int(self.array[self.index, 0])
+
+
+    @x.setter
+    def x(self, value):
+        self.array[self.index, 0] = value
+
+
+    @property
+    def y(self):
+        return int(self.array[self.index, 1])
+
+
+    @y.setter
+    def y(self, value):
+        self.array[self.index, 1] = value
+
+
+    def __array__(self, dtype=None, copy=None):
+        """Get the vector as a numpy array."""
+        return np.array(self.array[self.index], dtype=dtype)
+
+
+    def __len__(self):
+        return 2
+
+
+    def __getitem__(self, key):
+        return int(self.array[self.index, key])
+
 
-        self.x = getattr(obj, 'x', obj[0])
-        self.y = getattr(obj, 'y', obj[1])
+    def __iter__(self):
+        return iter(self.array[self.index].tolist())
 
 
-    def __getattr__(self, name):
-        """Get first or second element when requesting x or y attribute."""
-        if name == 'x':
-            return self[0]
-        elif name == 'y':
-            return self[1]
-        else:
-            return super().__getattr__(name)
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
 
 
-    def __setattr__(self, name, value):
-        """Set x and y attributes to first and second element."""
-        if name == 'x':
-            self[0] = value
-        elif name == 'y':
-            self[1] = value
-        else:
-            super().__setattr__(name, value)
+    def __add__(self, other):
+        return Vec2D(self.array[self.index] + np.asarray(other))
+
+
+    def __sub__(self, other):
+        return Vec2D(self.array[self.index] - np.asarray(other))
+
+
+    def __mul__(self, other):
+        return Vec2D(self.array[self.index] * other)
+
+
+    def __mod__(self, other):
+        return Vec2D(self.array[self.index] % other)
+
+
+    def __iadd__(self, other):
+        self.array[self.index] += np.asarray(other, dtype=np.int16)
+        return self
+
+
+    def __repr__(self):
+        return f'Vec2D({self.x}, {self.y})'
+
+
+    def copy(self):
+        """Copy the vector into its own array."""
+        return Vec2D(self)
+
+
+class layers:
+    """Collision layer bits, an object can be on several layers."""
+    WALL = 1
+    BREAKABLE = 2
+    PLAYER = 4
+    EXPLOSION = 8
+    BOMB = 16
+    ITEM = 32
 
 
 class DefaultObject:
     """Default object structure."""
-    def __init__(self, position, lifespan, color, text):
-        """Initialize the object at position with lifespan and color."""
-        self.sprite = pg.Rect(position.x, position.y, cfg.display.tile_size, cfg.display.tile_size)
+    __slots__ = ('sprite', 'position', 'vector', 'lifespan', 'color', 'text', 'slot', 'handle', 'cell')
+
+    # objects placed on the tile grid for collision queries
+    indexed = True
+
+    # objects that never move, drawn once to the static layer
+    static = False
+
+    # type code in the entity store
+    type_id = 0
+
+    # collision layers of the object and layers it collides with
+    layer = 0
+    mask = 0
+
+    # attributes changed during play, captured by world snapshots
+    state_attrs = ()
 
-        self.position = position
+    def __init__(self, position, lifespan, color, text, tile_size):
+        """Initialize the object at position with lifespan and color, one tile in size."""
+        self.sprite = pg.Rect(position.x, position.y, tile_size, tile_size)
+
+        # positions are copied, the object manager binds them to its store
+        self.position = Vec2D(position)
+        self.vector = None
         self.lifespan = lifespan
 
+        # set by the object manager
+        self.slot = None
+        self.handle = None
+        self.cell = None
+
         self.color = color
         self.text = text
 
 
-    def draw(self, screen, object_manager):
-        """Draw the object on the screen."""
-        pg.draw.rect(screen, self.color, self.sprite)
+    def get_state(self):
+        """Get the values of the state attributes."""
+        return tuple(getattr(self, attr) for attr in self.state_attrs)
+
+
+    def set_state(self, state):
+        """Set the values of the state attributes."""
+        for attr, value in zip(self.state_attrs, state):
+            setattr(self, attr, value)
+
+
+    def refresh(self, object_manager):
+        """Update sprite and text from the object state before drawing."""
+        return
+
+
+    def draw(self, screen, object_manager, offset=None):
+        """Draw the object on the screen, shifted by an offset if given."""
+        pg.draw.rect(screen, self.color, self.sprite.move(offset) if offset else self.sprite)
 
 
     def on_kill(self, object_manager):
@@ -69,23 +197,35 @@ class DefaultObject:
 
 class SolidWall(DefaultObject):
     """Unbreakable wall object."""
-    def __init__(self, position, color, text=None):
-        super().__init__(position, np.inf, color, text)
+    __slots__ = ()
+
+    static = True
+    type_id = 1
+    layer = layers.WALL
+
+    def __init__(self, position, color, tile_size, text=None):
+        super().__init__(position, np.inf, color, text, tile_size)
 
 
 class BreakableWall(DefaultObject):
     """Breakable wall object."""
-    def __init__(self, position, color, text=None):
-        super().__init__(position, np.inf, color, text)
+    __slots__ = ()
+
+    static = True
+    type_id = 2
+    layer = layers.WALL | layers.BREAKABLE
+
+    def __init__(self, position, color, tile_size, text=None):
+        super().__init__(position, np.inf, color, text, tile_size)
 
 
     def on_kill(self, object_manager):
         """Spawns item when wall is destroyed."""
-        if np.random.choice(range(10)) == 0:
+        if object_manager.rng.integers(10) == 0:
             item_type = None
             item_color = object_manager.cfg.colors.item_color
 
-            match np.random.choice(range(3)):
+            match object_manager.rng.integers(3):
                 case 0:
                     item_type = 'range'
                 case 1:
@@ -93,13 +233,26 @@ class BreakableWall(DefaultObject):
                 case 2:
                     item_type = 'speed'
 
-            object_manager.render_buffer.append(Item(self.position, item_type, item_color))
+            # items are optional, dropped under back-pressure
+            if object_manager.pressure >= 1:
+                object_manager.metrics['rejected'] += 1
+                return
+
+            object_manager.render_buffer.append(Item(self.position, item_type, item_color,
+                                                     object_manager.cfg.display.tile_size))
 
 
 class Player(DefaultObject):
     """Player object."""
-    def __init__(self, position, color, text=None):
-        super().__init__(position, np.inf, color, text)
+    __slots__ = ('n_bombs', 'n_lives', 'n_score', 'n_bomb_radius', 'n_speed', 'movement_buffer', 'action_buffer')
+
+    type_id = 3
+    layer = layers.PLAYER
+    mask = layers.WALL | layers.ITEM
+    state_attrs = ('n_bombs', 'n_lives', 'n_score', 'n_bomb_radius', 'n_speed', 'action_buffer')
+
+    def __init__(self, position, color, tile_size, text=None):
+        super().__init__(position, np.inf, color, text, tile_size)
 
         self.vector = Vec2D([0, 0])
 
@@ -109,21 +262,45 @@ class Player(DefaultObject):
         self.n_score = 0
         self.n_bomb_radius = 20
 
+        # pixels moved per tick, divides the tile size so moves stay on the grid
+        self.n_speed = 1
+
         # movement buffer
         self.movement_buffer = Vec2D([0, 0])
         self.action_buffer = []
 
 
-    def draw(self, screen, object_manager):
-        """Player is a dynamic object; update position and then draw."""
+    def get_state(self):
+        """Get the state attributes, with a copy of the action buffer."""
+        return super().get_state()[:-1] + (self.action_buffer.copy(),)
+
+
+    def set_state(self, state):
+        """Set the state attributes, with a copy of the action buffer."""
+        super().set_state(state[:-1] + (state[-1].copy(),))
+
+
+    def refresh(self, object_manager):
+        """Player is a dynamic object; update sprite position."""
         self.sprite.update(self.position, (self.sprite.width, self.sprite.height))
-        super().draw(screen, object_manager)
+
+
+    def draw(self, screen, object_manager, offset=None):
+        """Player is a dynamic object; update position and then draw."""
+        self.refresh(object_manager)
+        super().draw(screen, object_manager, offset)
 
 
 class Explosion(DefaultObject):
     """Explosion object."""
-    def __init__(self, position, player, color, text=None):
-        super().__init__(position, .5, color, text)
+    __slots__ = ('player',)
+
+    type_id = 4
+    layer = layers.EXPLOSION
+    mask = layers.BREAKABLE
+
+    def __init__(self, position, player, color, tile_size, text=None):
+        super().__init__(position, .5, color, text, tile_size)
 
         # player whose bomb created the explosion
         self.player = player
@@ -131,8 +308,17 @@ class Explosion(DefaultObject):
 
 class Bomb(DefaultObject):
     """Bomb object."""
-    def __init__(self, position, player, color, text=None):
-        super().__init__(position, 2, color, text)
+    __slots__ = ('radius', 'player', 'detonated')
+
+    type_id = 5
+    layer = layers.BOMB
+    state_attrs = ('detonated',)
+
+    # seconds until detonation
+    fuse = 2
+
+    def __init__(self, position, player, color, tile_size, text=None):
+        super().__init__(position, self.fuse, color, text, tile_size)
 
         # attributes
         self.vector = Vec2D([0, 0])
@@ -141,42 +327,41 @@ class Bomb(DefaultObject):
         # player that placed the bomb
         self.player = player
 
-
-    def draw(self, screen, object_manager):
-        """Bomb is a dynamic object; update position and then draw."""
-        self.sprite.update(self.position, (self.sprite.width, self.sprite.height))
-        super().draw(screen, object_manager)
+        # set once the explosion has been created
+        self.detonated = False
 
 
-    def create_explosion(self, object_manager, color):
-        """Creates cross-like explosion based on radius."""
-        explosions = [Explosion(self.position,
-                                player=self.player,
-                                color=color)]
-        _, sprites = object_manager.get_objects_sprites(SolidWall)
+    def refresh(self, object_manager):
+        """Bomb is a dynamic object; update sprite position."""
+        self.sprite.update(self.position, (self.sprite.width, self.sprite.height))
 
-        for vec in [[0, -1], [0, 1], [-1, 0], [1, 0]]:
-            for i in range(self.radius + 1):
-                explosion = Explosion(self.position + Vec2D(vec) * cfg.display.tile_size * i,
-                                      player=self.player,
-                                      color=color)
-                if explosion.sprite.collidelist(sprites) > 0:
-                    break
-                explosions += [explosion]
 
-        object_manager.render_buffer += explosions
+    def draw(self, screen, object_manager, offset=None):
+        """Bomb is a dynamic object; update position and then draw."""
+        self.refresh(object_manager)
+        super().draw(screen, object_manager, offset)
 
 
     def on_kill(self, object_manager):
-        """Creates explosion when bomb is destroyed."""
-        self.create_explosion(object_manager, color=object_manager.cfg.colors.explosion_color)
+        """Creates explosion when bomb is destroyed, unless already detonated."""
+        if not self.detonated:
+            object_manager.detonate([self])
 
 
 class Item(DefaultObject):
     """Item object."""
-    def __init__(self, position, item_type, color):
+    __slots__ = ('item_type', 'player')
+
+    type_id = 6
+    layer = layers.ITEM
+    state_attrs = ('player',)
+
+    def __init__(self, position, item_type, color, tile_size):
         self.item_type = item_type
 
+        # player that picked up the item
+        self.player = None
+
         match self.item_type:
             case 'range':
                 text = '+1'
@@ -187,68 +372,112 @@ class Item(DefaultObject):
             case _:
                 text = None
 
-        super().__init__(position, np.inf, color, text)
+        super().__init__(position, np.inf, color, text, tile_size)
 
 
-    def draw(self, screen, object_manager):
+    def draw(self, screen, object_manager, offset=None):
         """Draw the inner text and border for an item object."""
-        super().draw(screen, object_manager)
+        super().draw(screen, object_manager, offset)
+
+        sprite = self.sprite.move(offset) if offset else self.sprite
 
-        transparent = pg.Rect(self.position.x + 1, self.position.y + 1, self.sprite.width - 2, self.sprite.height - 2)
+        transparent = sprite.inflate(-2, -2)
         pg.draw.rect(screen, object_manager.cfg.colors.background_color, transparent)
 
         if self.text:
             font = object_manager.cfg.fonts.item_font
-            text = font.render(self.text, True, self.color)
-            text_rect = text.get_rect(center=self.sprite.center)
+            text = render_text(font, self.text, self.color, object_manager.cfg)
+            text_rect = text.get_rect(center=sprite.center)
 
             screen.blit(text, text_rect)
 
 
     def on_kill(self, object_manager):
-        """Increase bomb radius when item is destroyed."""
+        """Apply the item to the player that picked it up."""
+        if not self.player:
+            return
+
         match self.item_type:
             case 'range':
-                object_manager.player.n_bomb_radius += 1
+                self.player.n_bomb_radius += 1
             case 'lives':
-                pass
+                self.player.n_lives += 1
             case 'speed':
-                pass
+                self.player.n_speed = min(2 * self.player.n_speed, object_manager.cfg.core.max_player_speed)
 
 
 class DefaultCounter(DefaultObject):
     """Default counter object."""
+    __slots__ = ('value', 'surface')
+
+    # counters are drawn on top of the grid, not part of it
+    indexed = False
+    type_id = 7
+
     def __init__(self, position, color, text):
-        super().__init__(position, np.inf, color, text)
+        # sized to the text on refresh
+        super().__init__(position, np.inf, color, text, 0)
 
+        # counted value and text surface, rendered when the value changes
+        self.value = None
+        self.surface = None
 
-    def draw(self, screen, object_manager):
-        sprite = pg.Rect(self.position.x, self.position.y, *object_manager.cfg.fonts.score_font.size(self.text))
 
-        font = object_manager.cfg.fonts.score_font
-        text = font.render(self.text, True, self.color)
-        text_rect = text.get_rect(center=sprite.center)
+    def get_value(self):
+        """Get the counted value."""
+        return None
 
-        screen.blit(text, text_rect)
+
+    def format_value(self, value):
+        """Format the counted value as text."""
+        return str(value)
+
+
+    def refresh(self, object_manager):
+        """Render the text and fit the sprite to it if the value changed."""
+        value = self.get_value()
+
+        if value != self.value or not self.surface:
+            if value is not None:
+                self.text = self.format_value(value)
+            self.value = value
+
+            self.surface = render_text(object_manager.cfg.fonts.score_font, self.text, self.color, object_manager.cfg)
+            self.sprite.size = self.surface.get_size()
+
+
+    def draw(self, screen, object_manager, offset=None):
+        """Counters are drawn in screen coordinates, the offset is ignored."""
+        self.refresh(object_manager)
+        screen.blit(self.surface, self.sprite)
 
 
 class ScoreCounter(DefaultCounter):
     """Score counter object."""
-    def __init__(self, position, player, color, text='0' * cfg.display.n_score_digits):
-        super().__init__(position, color, text)
+    __slots__ = ('player', 'digits')
+
+    def __init__(self, position, player, color, digits=8):
+        super().__init__(position, color, '0' * digits)
         self.player = player
+        self.digits = digits
 
-    def draw(self, screen, object_manager):
-        self.text = str(self.player.n_score).zfill(cfg.display.n_score_digits)
-        super().draw(screen, object_manager)
+    def get_value(self):
+        return self.player.n_score
+
+    def format_value(self, value):
+        return str(value).zfill(self.digits)
 
 
 class LiveCounter(DefaultCounter):
     """Live counter object."""
+    __slots__ = ('player',)
+
     def __init__(self, position, player, color, text='0'):
         super().__init__(position, color, text)
         self.player = player
 
-    def draw(self, screen, object_manager):
-        self.text = str(self.player.n_lives).zfill(1)
-        super().draw(screen, object_manager)
\ No newline at end of file
+    def get_value(self):
+        return self.player.n_lives
+
+    def format_value(self, value):
+        return str(value).zfill(1)
\ No newline at end of file
@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pygame as pg
+
+import assets.objects as objects
+import mapgen
+
+from assets.objects import Vec2D
+from config import Config
+from session import GameSession
+
+
+def make_config(n_players=2, grid_shape=(21, 21)):
+    """Config with players in the corners of a map."""
+    cfg = Config()
+
+    cfg.core.no_players = n_players
+    cfg.core.player_spawn_positions = mapgen.spawn_positions(grid_shape, cfg.display.tile_size)
+
+    return cfg
+
+
+def free_cells(session):
+    """Screen positions of all tiles without walls."""
+    object_manager = session.object_manager
+    tile_size = session.cfg.display.tile_size
+
+    walls = np.zeros(object_manager.get_spatial_index(objects.SolidWall).shape, dtype=bool)
+    for cls in (objects.SolidWall, objects.BreakableWall):
+        walls |= object_manager.get_spatial_index(cls).counts > 0
+
+    # skip the counter rows above and below the map
+    walls[:, [0, -1]] = True
+
+    return np.argwhere(~walls) * tile_size
+
+
+def random_walk(session, rng, drop_rate):
+    """Per-tick actions: players keep a random direction and drop bombs at a rate."""
+    actions = np.zeros((session.cfg.core.no_players, 3), dtype=np.int8)
+
+    def policy(tick):
+        turn = rng.random(len(actions)) < .05
+        directions = np.array([(0, -1), (0, 1), (-1, 0), (1, 0)])[rng.integers(4, size=len(actions))]
+        actions[turn, :2] = directions[turn]
+        actions[:, 2] = rng.random(len(actions)) < drop_rate
+        return actions
+
+    return policy
+
+
+def scenario_idle(map_fname, seed):
+    """Two players standing still on the test map."""
+    cfg = make_config()
+    session = GameSession(map_fname, cfg=cfg, seed=seed)
+
+    return session, lambda tick: None
+
+
+def scenario_bomb_spam(map_fname, seed):
+    """Four players walking around and dropping a bomb every tick."""
+    cfg = make_config(n_players=4)
+    session = GameSession(map_fname, cfg=cfg, seed=seed)
+
+    for player in session.object_manager.players:
+        player.n_bombs = np.iinfo(np.int32).max
+
+    return session, random_walk(session, np.random.default_rng(seed), drop_rate=1)
+
+
+def scenario_chain_explosions(map_fname, seed):
+    """Every free tile holds a maximum radius bomb, one expiring bomb sets them all off."""
+    cfg = make_config()
+    session = GameSession(map_fname, cfg=cfg, seed=seed)
+    player = session.object_manager.players[1]
+    cells = free_cells(session)
+
+    def policy(tick):
+        # rearm the board every second
+        if tick % cfg.core.tick_rate == 0:
+            bombs = [objects.Bomb(Vec2D(cell), player=player, color=cfg.colors.bomb_color,
+                                  tile_size=cfg.display.tile_size) for cell in cells]
+            session.object_manager.add(bombs)
+            session.object_manager.set_lifespan(bombs[0], 0)
+
+    return session, policy
+
+
+def scenario_item_flood(map_fname, seed):
+    """Board flooded with items up to the object limit while players walk over them."""
+    cfg = make_config()
+    session = GameSession(map_fname, cfg=cfg, seed=seed)
+    cells = free_cells(session)
+    walk = random_walk(session, np.random.default_rng(seed), drop_rate=0)
+
+    def policy(tick):
+        object_manager = session.object_manager
+        n_items = len(object_manager.free_slots)
+        items = [objects.Item(Vec2D(cells[i % len(cells)]), ('range', 'lives', 'speed')[i % 3], cfg.colors.item_color,
+                              cfg.display.tile_size)
+                 for i in range(n_items)]
+        object_manager.add(items)
+
+        return walk(tick)
+
+    return session, policy
+
+
+def scenario_large_map(map_fname, seed, size=513):
+    """Four players dropping bombs on a generated large map, drawn through a camera."""
+    grid = mapgen.generate(size, size, seed=seed)
+    map_fname = os.path.join(tempfile.mkdtemp(), f'large_{size}.npy')
+    np.save(map_fname, grid)
+
+    cfg = make_config(n_players=4, grid_shape=grid.shape)
+    session = GameSession(map_fname, cfg=cfg, seed=seed)
+
+    return session, random_walk(session, np.random.default_rng(seed), drop_rate=.05)
+
+
+def scenario_bots(map_fname, seed):
+    """Four bots hunting each other on the test map."""
+    cfg = make_config(n_players=4)
+    cfg.core.no_bots = 4
+    session = GameSession(map_fname, cfg=cfg, seed=seed)
+
+    return session, lambda tick: None
+
+
+# fresh interpreter creating one headless session, as a batch worker would
+COLD_START = """
+import sys, time
+start = time.perf_counter()
+from config import Config
+from session import GameSession
+imported = time.perf_counter()
+GameSession(sys.argv[1], cfg=Config(), seed=0)
+created = time.perf_counter()
+print(1000 * (imported - start), 1000 * (created - imported))
+"""
+
+
+def cold_start(map_fname, n_runs=5):
+    """Median milliseconds to start an interpreter, import the game and create a headless session."""
+    times = []
+
+    for i in range(n_runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', COLD_START, map_fname], capture_output=True, text=True,
+                                check=True, env=dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT='1')).stdout
+        total = 1000 * (time.perf_counter() - start)
+
+        times.append([float(value) for value in output.split()] + [total])
+
+    import_ms, session_ms, total_ms = np.median(times, axis=0)
+
+    return {'import_ms': import_ms, 'session_ms': session_ms, 'total_ms': total_ms}
+
+
+SCENARIOS = {'idle': scenario_idle,
+             'bomb_spam': scenario_bomb_spam,
+             'chain_explosions': scenario_chain_explosions,
+             'item_flood': scenario_item_flood,
+             'large_map': scenario_large_map,
+             'bots': scenario_bots}
+
+
+def run(session, policy, n_ticks, screen=None):
+    """Step a session n ticks, drawing to screen if given, returns ticks per second."""
+    start = time.perf_counter()
+
+    for tick in range(n_ticks):
+        session.step(policy(tick))
+        if screen:
+            session.draw(screen)
+
+    return n_ticks / (time.perf_counter() - start)
+
+
+def benchmark(name, map_fname, n_ticks, seed=0):
+    """Measure simulation, simulation plus offscreen rendering and peak memory of a scenario."""
+    scenario = SCENARIOS[name]
+
+    session, policy = scenario(map_fname, seed)
+    sim_tps = run(session, policy, n_ticks)
+
+    session, policy = scenario(map_fname, seed)
+    screen = pg.Surface((session.cfg.display.screen_width, session.cfg.display.screen_height))
+    render_tps = run(session, policy, n_ticks, screen=screen)
+
+    # memory is traced in a separate run, tracing slows everything down
+    tracemalloc.start()
+    session, policy = scenario(map_fname, seed)
+    run(session, policy, n_ticks)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'scenario': name, 'ticks': n_ticks, 'sim_tps': sim_tps, 'render_tps': render_tps,
+            'peak_memory': peak_memory, 'objects': session.object_manager.object_counts,
+            'capacity': session.object_manager.metrics}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ticks', type=int, default=960, help='ticks per scenario')
+    parser.add_argument('--map', default=os.path.join('assets', 'maps', 'test.npy'), help='map for fixed map scenarios')
+    parser.add_argument('--out', default='bench.json', help='JSON file for the results')
+    parser.add_argument('scenarios', nargs='*', default=list(SCENARIOS), help='scenarios to run')
+    args = parser.parse_args()
+
+    startup = cold_start(args.map)
+    print(f"{'cold_start':<20}{startup['import_ms']:>10.1f} ms import{startup['session_ms']:>10.1f} ms session"
+          f"{startup['total_ms']:>10.1f} ms total")
+
+    results = []
+    for name in args.scenarios:
+        result = benchmark(name, args.map, args.ticks)
+        results.append(result)
+        print(f"{name:<20}{result['sim_tps']:>10.0f} sim ticks/s{result['render_tps']:>10.0f} render ticks/s"
+              f"{result['peak_memory'] / 2 ** 20:>8.1f} MiB")
+
+    with open(args.out, 'w') as f:
+        json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'pygame': pg.version.ver,
+                   'cold_start': startup, 'results': results}, f, indent=2)
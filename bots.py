@@ -0,0 +1,371 @@
+import heapq
+
+from collections import OrderedDict, deque
+
+import numpy as np
+
+import assets.objects as objects
+
+from core import actions, blast_cells
+
+
+# cell offsets of the up, down, left and right neighbours
+NEIGHBOURS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+# distance of cells a field cannot reach
+UNREACHABLE = np.iinfo(np.int32).max
+
+
+def propagate(passable, field, queue):
+    """Relax distances breadth first from queued cells over passable cells."""
+    width, height = len(field), len(field[0])
+
+    while queue:
+        i, j = queue.popleft()
+        distance = field[i][j] + 1
+
+        for di, dj in NEIGHBOURS:
+            ni, nj = i + di, j + dj
+            if 0 <= ni < width and 0 <= nj < height and passable[ni][nj] and field[ni][nj] > distance:
+                field[ni][nj] = distance
+                queue.append((ni, nj))
+
+
+def search(passable, target, goal, bound=UNREACHABLE):
+    """Distance from a target to a goal cell over passable cells, unreachable if more than bound.
+
+    A* towards the goal that follows the deepest cell among equal estimates, so the cost grows
+    with the distance and detours and not with the grid.
+    """
+    width, height = len(passable), len(passable[0])
+    gi, gj = goal
+
+    distances = {target: 0}
+    queue = [(abs(target[0] - gi) + abs(target[1] - gj), 0, target)]
+
+    while queue:
+        estimate, negative, current = heapq.heappop(queue)
+        if estimate > bound:
+            break
+
+        distance = -negative
+        if current == goal:
+            return distance
+
+        if distance > distances[current]:
+            continue
+
+        i, j = current
+        for di, dj in NEIGHBOURS:
+            ni, nj = i + di, j + dj
+            if (0 <= ni < width and 0 <= nj < height and passable[ni][nj] and
+                    distances.get((ni, nj), UNREACHABLE) > distance + 1):
+                distances[(ni, nj)] = distance + 1
+                heapq.heappush(queue, (distance + 1 + abs(ni - gi) + abs(nj - gj), -distance - 1, (ni, nj)))
+
+    return UNREACHABLE
+
+
+class FieldCache:
+    """Distance and danger fields on the tile grid, shared by all bots of a match."""
+    def __init__(self, object_manager, max_fields=64):
+        """Read the walls and bombs of the world and follow its changes."""
+        self.object_manager = object_manager
+        self.cfg = object_manager.cfg
+        self.max_fields = max_fields
+
+        # passable cells, without walls and through breakable walls
+        solid = object_manager.get_spatial_index(objects.SolidWall).counts > 0
+        breakable = object_manager.get_spatial_index(objects.BreakableWall).counts > 0
+
+        self.open = (~solid & ~breakable).tolist()
+        self.diggable = (~solid).tolist()
+
+        # distance fields by target cell and passability, and routes by target cell, cell and
+        # passability, least recently used first
+        self.fields = OrderedDict()
+        self.routes = OrderedDict()
+
+        # match time at which a cell is hit, from bombs and burning explosions
+        self.danger = np.full(solid.shape, np.inf)
+
+        # blast deadline and cells by slot, and deadline by slot per covered cell
+        self.sources = dict()
+        self.coverage = dict()
+        self.bombs = set()
+
+        for cls in (objects.Bomb, objects.Explosion):
+            for obj in object_manager.type_lists.get(cls, dict()).values():
+                self.on_link(obj)
+
+        object_manager.observers.append(self)
+
+
+    def distances(self, target, dig=False):
+        """Get the distance field to a cell, walking through breakable walls if dig is set."""
+        key = (target, dig)
+
+        if key in self.fields:
+            self.fields.move_to_end(key)
+            return self.fields[key]
+
+        passable = self.diggable if dig else self.open
+        field = [[UNREACHABLE] * len(passable[0]) for i in range(len(passable))]
+
+        if target:
+            field[target[0]][target[1]] = 0
+            propagate(passable, field, deque([target]))
+
+        self.fields[key] = field
+
+        if len(self.fields) > self.max_fields:
+            self.fields.popitem(last=False)
+
+        return field
+
+
+    def route(self, target, cell, dig=False):
+        """Get the distances from a target to a cell and to its open neighbours one step closer.
+
+        Unlike distance fields, routes only search towards the cell, missing cells are not closer.
+        """
+        key = (target, cell, dig)
+
+        if key in self.routes:
+            self.routes.move_to_end(key)
+            return self.routes[key]
+
+        passable = self.diggable if dig else self.open
+        route = dict()
+
+        if target:
+            distance = route[cell] = search(passable, target, cell)
+
+            if 0 < distance < UNREACHABLE:
+                i, j = cell
+                for di, dj in NEIGHBOURS:
+                    neighbour = ni, nj = i + di, j + dj
+                    if (0 <= ni < len(passable) and 0 <= nj < len(passable[0]) and self.open[ni][nj] and
+                            search(passable, target, neighbour, bound=distance - 1) == distance - 1):
+                        route[neighbour] = distance - 1
+
+        self.routes[key] = route
+
+        if len(self.routes) > self.max_fields:
+            self.routes.popitem(last=False)
+
+        return route
+
+
+    def blast(self, cell, radius):
+        """Get the cells a bomb in a cell would reach."""
+        object_manager = self.object_manager
+        solid = object_manager.get_spatial_index(objects.SolidWall).counts > 0
+        breakable = object_manager.get_spatial_index(objects.BreakableWall).counts > 0
+
+        _, cells = blast_cells(np.array([cell]), np.array([radius]), solid, breakable)
+
+        return [tuple(cell) for cell in cells.tolist()]
+
+
+    def add_source(self, slot, deadline, cells):
+        """Mark cells hit at a deadline, bombs in them go off at the same time."""
+        bomb_index = self.object_manager.get_spatial_index(objects.Bomb)
+        stack = [(slot, deadline, cells)]
+
+        while stack:
+            slot, deadline, cells = stack.pop()
+
+            if slot in self.sources:
+                self.remove_source(slot)
+
+            self.sources[slot] = (deadline, cells)
+
+            for cell in cells:
+                self.coverage.setdefault(cell, dict())[slot] = deadline
+                self.danger[cell] = min(self.danger[cell], deadline)
+
+                for other in bomb_index.at(cell):
+                    if other in self.sources and self.sources[other][0] > deadline:
+                        stack.append((other, deadline, self.sources[other][1]))
+
+
+    def remove_source(self, slot):
+        """Unmark the cells of a blast."""
+        _, cells = self.sources.pop(slot)
+
+        for cell in cells:
+            covering = self.coverage[cell]
+            del covering[slot]
+            self.danger[cell] = min(covering.values(), default=np.inf)
+
+            if not covering:
+                del self.coverage[cell]
+
+
+    def reblast(self, cell):
+        """Recompute the blasts of bombs whose rays end in a cell."""
+        for slot in [slot for slot in self.coverage.get(cell, ()) if slot in self.bombs]:
+            bomb = self.object_manager.render_list[slot]
+            self.add_source(slot, self.sources[slot][0], self.blast(bomb.cell, bomb.radius))
+
+
+    def on_link(self, obj):
+        """Follow walls, bombs and explosions entering the world."""
+        if isinstance(obj, objects.Bomb):
+            store = self.object_manager.store
+            deadline = self.object_manager.time + store.lifespan_limits[obj.slot] - store.lifespan_counts[obj.slot]
+
+            # bombs already covering the cell set it off earlier
+            covering = self.coverage.get(obj.cell, dict())
+            deadline = min([deadline] + [covering[slot] for slot in covering if slot in self.bombs])
+
+            self.bombs.add(obj.slot)
+            self.add_source(obj.slot, deadline, self.blast(obj.cell, obj.radius))
+        elif isinstance(obj, objects.Explosion):
+            self.add_source(obj.slot, self.object_manager.time, [obj.cell])
+        elif isinstance(obj, (objects.SolidWall, objects.BreakableWall)):
+            i, j = obj.cell
+            self.open[i][j] = False
+            self.diggable[i][j] = self.diggable[i][j] and isinstance(obj, objects.BreakableWall)
+
+            # distances can only grow, drop the affected fields
+            for key in [key for key in self.fields if not key[1] or isinstance(obj, objects.SolidWall)]:
+                del self.fields[key]
+
+            # routes also depend on the open neighbours of their cell
+            self.routes.clear()
+
+            self.reblast(obj.cell)
+
+
+    def on_unlink(self, obj):
+        """Follow walls, bombs and explosions leaving the world."""
+        if isinstance(obj, (objects.Bomb, objects.Explosion)):
+            self.bombs.discard(obj.slot)
+            self.remove_source(obj.slot)
+        elif isinstance(obj, objects.BreakableWall):
+            i, j = obj.cell
+            self.open[i][j] = True
+
+            # routes through open cells may get shorter, cells next to it get an open neighbour
+            for key in [key for key in self.routes
+                        if not key[2] or abs(key[1][0] - i) + abs(key[1][1] - j) == 1]:
+                del self.routes[key]
+
+            # distances can only shrink, relax from the opened cell
+            for (target, dig), field in self.fields.items():
+                if dig:
+                    continue
+
+                distance = min(field[i + di][j + dj] for di, dj in NEIGHBOURS
+                               if 0 <= i + di < len(field) and 0 <= j + dj < len(field[0]))
+
+                if distance < UNREACHABLE and distance + 1 < field[i][j]:
+                    field[i][j] = distance + 1
+                    propagate(self.open, field, deque([(i, j)]))
+
+            self.reblast(obj.cell)
+
+
+    def escape(self, cell, blast=(), deadline=np.inf):
+        """Next cell towards the nearest safe cell, None if there is no way out in time."""
+        danger = self.danger
+        now = self.object_manager.time
+
+        # seconds to walk one cell at one pixel per tick
+        seconds = self.cfg.display.tile_size / self.cfg.core.tick_rate
+
+        blast = set(blast)
+        width, height = danger.shape
+
+        parents = {cell: None}
+        queue = deque([(cell, 0)])
+
+        while queue:
+            (i, j), steps = queue.popleft()
+
+            if danger[i, j] == np.inf and (i, j) not in blast:
+                # walk back to the first step
+                while parents[(i, j)] and parents[(i, j)] != cell:
+                    i, j = parents[(i, j)]
+                return i, j
+
+            for di, dj in NEIGHBOURS:
+                neighbour = ni, nj = i + di, j + dj
+
+                if not (0 <= ni < width and 0 <= nj < height) or not self.open[ni][nj] or neighbour in parents:
+                    continue
+
+                # cell has to be left before it is hit
+                hit = min(danger[ni, nj], deadline if neighbour in blast else np.inf)
+                if hit > now + (steps + 2) * seconds:
+                    parents[neighbour] = (i, j)
+                    queue.append((neighbour, steps + 1))
+
+
+class Bot:
+    """CPU player, steers through the shared fields into its movement and action buffers."""
+    def __init__(self, player, fields, action_manager):
+        self.player = player
+        self.fields = fields
+        self.action_manager = action_manager
+        self.cfg = action_manager.cfg
+
+
+    def has_bomb(self):
+        """Check for a bomb of the player in the world or queued."""
+        store = self.fields.object_manager.store
+
+        if actions.DROP_BOMB in self.player.action_buffer:
+            return True
+
+        return bool(np.any((store.owners == self.player.slot) & (store.types == objects.Bomb.type_id)))
+
+
+    def target(self, cell):
+        """Get the distances around a cell to the nearest other player, through breakable walls."""
+        routes = [self.fields.route(player.cell, cell, dig=True)
+                  for player in self.fields.object_manager.players if player is not self.player]
+
+        return min(routes, key=lambda route: route.get(cell, UNREACHABLE), default=None)
+
+
+    def act(self):
+        """Choose movement and bomb drops, only on grid aligned positions."""
+        player = self.player
+        tile_size = self.cfg.display.tile_size
+
+        if player.position.x % tile_size or player.position.y % tile_size:
+            return
+
+        fields = self.fields
+        cell = i, j = player.cell
+        step = cell
+
+        if fields.danger[cell] < np.inf:
+            # run from blasts first
+            step = fields.escape(cell) or cell
+        else:
+            route = self.target(cell)
+            distance = route.get(cell, UNREACHABLE) if route is not None else UNREACHABLE
+
+            if distance < UNREACHABLE:
+                # open neighbours closer to the target, else the way is blocked by breakable walls
+                closer = [(i + di, j + dj) for di, dj in NEIGHBOURS
+                          if route.get((i + di, j + dj)) == distance - 1]
+
+                if closer and distance > 1:
+                    if fields.danger[closer[0]] == np.inf:
+                        step = closer[0]
+                elif not self.has_bomb():
+                    # blast the way open or the target, if there is a way out
+                    blast = fields.blast(cell, player.n_bomb_radius)
+                    escape = fields.escape(cell, blast, fields.object_manager.time + objects.Bomb.fuse)
+
+                    if escape:
+                        self.action_manager.request_bomb(player)
+                        step = escape
+
+        player.movement_buffer.x = step[0] - i
+        player.movement_buffer.y = step[1] - j
@@ -24,30 +24,66 @@ class Config:
 
         self.display.tile_size = 32
 
+        # frames per second, the simulation runs at its own tick rate
         self.display.refresh_rate = 96
 
+        # only push changed regions to the display
+        self.display.dirty_rects = False
+
         self.display.n_score_digits = 8
 
+        # number of rendered text surfaces kept in memory
+        self.display.text_cache_size = 256
+
+        # frame buffers of the recorder, and the most frames it skips between captures under load
+        self.display.capture_buffers = 16
+        self.display.capture_max_stride = 8
+
         # core
         self.core.no_players = 2
 
-        # TODO: set counter positions for player 3 and 4
+        # the last no_bots players are controlled by bots, see bots.py
+        self.core.no_bots = 0
+
+        # speed items double the pixels a player moves per tick up to this, it has to divide the tile size
+        self.core.max_player_speed = 4
+
         self.core.player_spawn_positions = [(32, 64),
                                             (32, 64),
-                                            (32, 32),
-                                            (32, 32)]
+                                            (self.display.screen_width - 64, self.display.screen_height - 96),
+                                            (self.display.screen_width - 64, 64)]
         self.core.score_counter_positions = [(0, 16),
                                              (self.display.screen_width - 16 * 5, 16),
-                                             (self.display.screen_height - 32, 32),
-                                             (32, 32)]
+                                             (0, self.display.screen_height - 16),
+                                             (self.display.screen_width - 16 * 5, self.display.screen_height - 16)]
         self.core.live_counter_positions = [(0, 0),
                                             (self.display.screen_width - 8, 0),
-                                            (32, 32),
-                                            (32, 32)]
+                                            (0, self.display.screen_height - 32),
+                                            (self.display.screen_width - 8, self.display.screen_height - 32)]
 
         self.core.window_caption = 'Bomberman'
+
+        # initial number of object slots, doubled whenever they run out
         self.core.object_limit = 2048
 
+        # above this many objects optional objects like item drops are rejected
+        self.core.soft_object_limit = 1 << 16
+
+        # halve the slots again when at most a quarter of them is used
+        self.core.shrink_objects = False
+
+        # simulation ticks per second, independent of the refresh rate
+        self.core.tick_rate = 96
+
+        # ticks stepped at most per frame before the game slows down
+        self.core.max_catch_up_ticks = 8
+
+        # headless matches end after this many ticks
+        self.core.max_ticks = 96 * 60 * 3
+
+        # matches a server keeps waiting for players, joins of further new matches are refused
+        self.core.max_pending_matches = 64
+
         # scores
         self.core.score_per_wall = 10
         self.core.score_per_item = 50
@@ -81,6 +117,9 @@ class Config:
         self.controls.k_p1_drop_bomb = 32
         self.controls.k_p2_drop_bomb = 13
 
+        # gamepad button dropping bombs, hats move
+        self.controls.gamepad_drop_bomb = 0
+
         self.controls.k_pause = 27
 
 
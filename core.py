@@ -1,5 +1,7 @@
+import gc
 import os
 import sys
+import time
 
 import numpy as np
 import pygame as pg
@@ -7,11 +9,15 @@ import pygame as pg
 import assets.objects as objects
 
 from assets.objects import Vec2D
-from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
 
 
 def init(cfg):
     """Configures and initializes necessary pygame objects."""
+    # only the display is needed, fonts load on first render
+    pg.display.init()
+
     # config screen
     width = cfg.display.screen_width
     height = cfg.display.screen_height
@@ -33,39 +39,50 @@ def quit():
     sys.exit()
 
 
-def load_font(fname, size):
-    """Load font from file."""
-    return pg.font.Font(os.path.join('assets', 'fonts', fname), size)
+def load_map(fname, cfg=None):
+    """Load map from binary NPY file."""
+    template = load_template(fname, cfg)
 
+    return [template.clone(obj) for obj in template.prototypes]
 
-def load_fonts(cfg):
-    """Load fonts from config."""
-    for key, value in cfg.fonts.__dict__.items():
-        font_family, font_size = value
-        setattr(cfg.fonts, key, load_font(font_family, font_size))
 
+@contextmanager
+def paused_gc():
+    """Pause garbage collection, bulk allocations would otherwise trigger full heap scans."""
+    enabled = gc.isenabled()
+    gc.disable()
 
-def load_map(fname, cfg=None):
-    """Load map from binary NPY file."""
-    grid = np.load(fname)
-    objs = []
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# parsed maps by file name, see load_template
+templates = dict()
+
+
+def load_template(fname, cfg=None):
+    """Get the parsed map of a file, parsed again when the file changed."""
+    mtime = os.path.getmtime(fname)
+    template = templates.get(fname)
 
-    for i in range(grid.shape[0]):
-        for j in range(grid.shape[1]):
-            location = Vec2D([i * cfg.display.tile_size, + j * cfg.display.tile_size + 32])
-            if grid[i][j] == 1:
-                objs.append(objects.SolidWall(location, color=cfg.colors.solid_wall_color))
-            if grid[i][j] == 2:
-                objs.append(objects.BreakableWall(location, color=cfg.colors.breakable_wall_color))
+    if not template or template.mtime != mtime or template.cfg is not cfg:
+        with paused_gc():
+            template = templates[fname] = MapTemplate(fname, cfg)
 
-    return objs
+    return template
 
 
-def add_players(object_manager, cfg):
-    """Add players to object manager."""
+def add_players(object_manager, cfg, spawn_positions=None):
+    """Add players to object manager, at the configured spawn positions if none are given."""
+    spawn_positions = spawn_positions or cfg.core.player_spawn_positions
+
     for i in range(cfg.core.no_players):
-        object_manager.add(objects.Player(Vec2D(cfg.core.player_spawn_positions[i]),
-                                          color=cfg.colors.player_colors[i]))
+        object_manager.add(objects.Player(Vec2D(spawn_positions[i]),
+                                          color=cfg.colors.player_colors[i],
+                                          tile_size=cfg.display.tile_size))
 
 
 def add_counters(object_manager, cfg):
@@ -77,7 +94,8 @@ def add_counters(object_manager, cfg):
                            color=cfg.colors.player_colors[i]))
         object_manager.add(objects.ScoreCounter(Vec2D(cfg.core.score_counter_positions[i]),
                            player=player,
-                           color=cfg.colors.player_colors[i]))
+                           color=cfg.colors.player_colors[i],
+                           digits=cfg.display.n_score_digits))
 
 
 class PlayerContainer:
@@ -98,109 +116,945 @@ class PlayerContainer:
         return getattr(self, 'player_' + str(key))
 
 
+@lru_cache(maxsize=None)
+def ray_table(radius):
+    """Cell offsets of the up, down, left and right explosion rays."""
+    directions = np.array([[0, -1], [0, 1], [-1, 0], [1, 0]])
+    steps = np.arange(1, radius + 1)
+
+    return directions[:, None, :] * steps[None, :, None]
+
+
+def blast_cells(centers, radii, solid, breakable):
+    """Cells reached by the blasts of bombs, returns bomb index and cell per reached cell."""
+    shape = np.array(solid.shape)
+
+    # cells of all rays of all bombs at once, (bombs, rays, steps, 2)
+    cells = centers[:, None, None, :] + ray_table(int(radii.max()))[None]
+
+    inside = np.all((cells >= 0) & (cells < shape), axis=-1)
+    cells = np.clip(cells, 0, shape - 1)
+
+    # rays stop at solid walls and bounds, and right after breakable walls
+    steps = np.arange(cells.shape[2])
+    blocked = solid[cells[..., 0], cells[..., 1]] | ~inside | (steps >= radii[:, None, None])
+    blocked[..., 1:] |= breakable[cells[..., 0], cells[..., 1]][..., :-1]
+
+    reached = ~np.logical_or.accumulate(blocked, axis=-1)
+
+    # bomb centers first, then the reached ray cells
+    idxs, rays, steps = np.nonzero(reached)
+    owners = np.concatenate([np.arange(len(centers)), idxs])
+    blast = np.concatenate([centers, cells[idxs, rays, steps]])
+
+    return owners, blast
+
+
+class MapTemplate:
+    """Walls, masks and tile grids of a map file, cloned into new worlds."""
+    def __init__(self, fname, cfg=None):
+        """Parse a memory mapped grid into wall prototypes."""
+        self.cfg = cfg
+        self.mtime = os.path.getmtime(fname)
+
+        # grid is paged in from the file, never copied
+        self.grid = np.load(fname, mmap_mode='r')
+
+        self.solid = self.grid == 1
+        self.breakable = self.grid == 2
+
+        # world in pixels, with a counter row above and below the map
+        self.size = (self.grid.shape[0] * cfg.display.tile_size, (self.grid.shape[1] + 2) * cfg.display.tile_size)
+
+        # walls in grid order, slots of a new world follow the same order
+        cells = np.argwhere(self.solid | self.breakable)
+        self.positions = (cells * cfg.display.tile_size + (0, 32)).astype(np.int16)
+
+        self.prototypes = []
+        for (i, j), position in zip(cells.tolist(), self.positions.tolist()):
+            if self.solid[i, j]:
+                self.prototypes.append(objects.SolidWall(Vec2D(position), color=cfg.colors.solid_wall_color,
+                                                         tile_size=cfg.display.tile_size))
+            else:
+                self.prototypes.append(objects.BreakableWall(Vec2D(position), color=cfg.colors.breakable_wall_color,
+                                                             tile_size=cfg.display.tile_size))
+
+        self.types = np.array([obj.type_id for obj in self.prototypes], dtype=np.int8)
+
+        # tile grids of walls by type, as slots of a new world
+        self.spatial_indices = dict()
+        for slot, obj in enumerate(self.prototypes):
+            if type(obj) not in self.spatial_indices:
+                self.spatial_indices[type(obj)] = SpatialIndex(self.size, cfg.display.tile_size)
+
+            spatial_index = self.spatial_indices[type(obj)]
+            obj.cell = spatial_index.cell(obj.position)
+            spatial_index.insert(slot, obj.cell)
+
+        # static layers by screen size, baked on first use
+        self.static_layers = dict()
+
+
+    def clone(self, prototype, position=True):
+        """Copy a wall prototype, sharing nothing mutable."""
+        # walls only have default object attributes, copied without copy.copy overhead
+        obj = object.__new__(type(prototype))
+        obj.sprite = prototype.sprite.copy()
+        obj.position = prototype.position.copy() if position else None
+        obj.vector = None
+        obj.lifespan = prototype.lifespan
+        obj.color = prototype.color
+        obj.text = prototype.text
+        obj.slot = prototype.slot
+        obj.handle = prototype.handle
+        obj.cell = prototype.cell
+
+        return obj
+
+
+    def static_layer(self, size):
+        """Get the walls drawn to a layer of a size."""
+        if size not in self.static_layers:
+            layer = pg.Surface(size)
+            layer.fill(self.cfg.colors.background_color)
+
+            for obj in self.prototypes:
+                obj.draw(layer, None)
+
+            self.static_layers[size] = layer
+
+        return self.static_layers[size]
+
+
+    def instantiate(self, object_manager, static_layer=False):
+        """Fill an empty world with clones of the walls, with a copy of the static layer if set."""
+        n = len(self.prototypes)
+        store = object_manager.store
+
+        # walls take the first slots
+        slots = object_manager.free_slots[-n:][::-1]
+        del object_manager.free_slots[-n:]
+
+        store.positions[:n] = self.positions
+        store.previous[:n] = self.positions
+        store.vectors[:n] = 0
+        store.lifespan_counts[:n] = 0
+        store.lifespan_limits[:n] = np.inf
+        store.types[:n] = self.types
+        store.owners[:n] = -1
+        store.alive[:n] = True
+
+        render_list = object_manager.render_list
+        type_lists = {cls: object_manager.type_lists.setdefault(cls, dict()) for cls in self.spatial_indices}
+        generations = object_manager.generations[:n].tolist()
+
+        for slot, prototype, generation in zip(slots, self.prototypes, generations):
+            obj = self.clone(prototype, position=False)
+            obj.slot = slot
+            obj.handle = generation << 32 | slot
+            obj.position = Vec2D.bind(store.positions, slot)
+
+            render_list[slot] = obj
+            type_lists[type(obj)][slot] = obj
+
+        for cls, spatial_index in self.spatial_indices.items():
+            clone = object_manager.get_spatial_index(cls)
+            clone.cells = {cell: set(slots) for cell, slots in spatial_index.cells.items()}
+            clone.counts[:] = spatial_index.counts
+
+        object_manager.object_counts += n
+        object_manager.n_walls = n
+
+        # worlds larger than the screen are drawn through a camera instead
+        size = (self.cfg.display.screen_width, self.cfg.display.screen_height)
+
+        if static_layer and self.size[0] <= size[0] and self.size[1] <= size[1]:
+            object_manager.static_layer = self.static_layer(size).copy()
+
+        for observer in object_manager.observers:
+            for slot in slots:
+                observer.on_link(object_manager.render_list[slot])
+
+
+class EntityStore:
+    """Structure of arrays holding the per slot state of all objects."""
+    columns = ('positions', 'vectors', 'movements', 'lifespan_counts', 'lifespan_limits',
+               'types', 'owners', 'alive')
+
+    # value of free rows per column
+    defaults = {'positions': 0, 'previous': 0, 'vectors': 0, 'movements': 0, 'lifespan_counts': 0, 'lifespan_limits': np.inf,
+                'expired': False, 'types': 0, 'owners': -1, 'alive': False}
+
+    def __init__(self, capacity):
+        """Preallocate columns for capacity slots."""
+        self.positions = np.zeros((capacity, 2), dtype=np.int16)
+        self.vectors = np.zeros((capacity, 2), dtype=np.int16)
+        self.movements = np.zeros((capacity, 2), dtype=np.int16)
+
+        # positions at the start of the tick, for interpolated rendering
+        self.previous = np.zeros((capacity, 2), dtype=np.int16)
+
+        self.lifespan_counts = np.zeros(capacity)
+        self.lifespan_limits = np.repeat(np.inf, capacity)
+        self.expired = np.zeros(capacity, dtype=bool)
+
+        self.types = np.zeros(capacity, dtype=np.int8)
+        self.owners = np.full(capacity, -1, dtype=np.int32)
+        self.alive = np.zeros(capacity, dtype=bool)
+
+
+    @property
+    def capacity(self):
+        """Number of slots."""
+        return len(self.alive)
+
+
+    def resize(self, capacity):
+        """Reallocate all columns for capacity slots, keeping the rows that fit."""
+        for name, default in self.defaults.items():
+            column = getattr(self, name)
+            resized = np.full((capacity,) + column.shape[1:], default, dtype=column.dtype)
+
+            n = min(capacity, len(column))
+            resized[:n] = column[:n]
+
+            setattr(self, name, resized)
+
+
+    def attach(self, slot, obj):
+        """Point the vectors of an object at a slot."""
+        obj.position = Vec2D.bind(self.positions, slot)
+
+        if obj.vector is not None:
+            obj.vector = Vec2D.bind(self.vectors, slot)
+
+        if isinstance(obj, objects.Player):
+            obj.movement_buffer = Vec2D.bind(self.movements, slot)
+
+
+    def bind(self, slot, obj):
+        """Copy object state into a slot and point its vectors at the store."""
+        self.positions[slot] = obj.position
+        self.previous[slot] = obj.position
+        self.vectors[slot] = obj.vector if obj.vector is not None else 0
+
+        if isinstance(obj, objects.Player):
+            self.movements[slot] = obj.movement_buffer
+
+        self.attach(slot, obj)
+
+        self.lifespan_counts[slot] = 0
+        self.lifespan_limits[slot] = obj.lifespan
+
+        # owner is the slot of the player the object belongs to
+        player = obj if isinstance(obj, objects.Player) else getattr(obj, 'player', None)
+
+        self.types[slot] = obj.type_id
+        self.owners[slot] = player.slot if player and player.slot is not None else -1
+        self.alive[slot] = True
+
+
+    def unbind(self, slot, obj):
+        """Copy object vectors out of a freed slot and reset it."""
+        obj.position = obj.position.copy()
+
+        if obj.vector is not None:
+            obj.vector = obj.vector.copy()
+
+        if isinstance(obj, objects.Player):
+            obj.movement_buffer = obj.movement_buffer.copy()
+
+        self.lifespan_counts[slot] = 0
+        self.lifespan_limits[slot] = np.inf
+
+        self.types[slot] = 0
+        self.owners[slot] = -1
+        self.alive[slot] = False
+
+
+class WorldState:
+    """Captured world state, see ObjectManager.snapshot."""
+    __slots__ = ('columns', 'generations', 'wall_columns', 'wall_generations', 'killed_walls', 'free_slots',
+                 'render_list', 'render_buffer', 'rng_state', 'time', 'states')
+
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
+class SpatialIndex:
+    """Tile grid mapping cells to the slots of the objects placed in them."""
+    def __init__(self, size, tile_size):
+        """Initialize an empty grid covering a world of a size in pixels."""
+        self.tile_size = tile_size
+        self.shape = (size[0] // tile_size, size[1] // tile_size)
+
+        # slots by occupied cell, large worlds are mostly empty per type
+        self.cells = dict()
+
+        # number of slots per cell, for vectorized occupancy masks
+        self.counts = np.zeros(self.shape, dtype=np.int16)
+
+
+    def cell(self, position):
+        """Get the cell containing a position, None if out of bounds."""
+        i = int(position[0]) // self.tile_size
+        j = int(position[1]) // self.tile_size
+
+        if 0 <= i < self.shape[0] and 0 <= j < self.shape[1]:
+            return i, j
+
+
+    def at(self, cell):
+        """Get the slots placed in a cell."""
+        return self.cells.get((cell[0], cell[1]), ())
+
+
+    def insert(self, slot, cell):
+        """Place a slot in a cell."""
+        if cell:
+            slots = self.cells.setdefault(cell, set())
+            slots.add(slot)
+            self.counts[cell] = len(slots)
+
+
+    def remove(self, slot, cell):
+        """Remove a slot from a cell."""
+        if cell in self.cells:
+            slots = self.cells[cell]
+            slots.discard(slot)
+            self.counts[cell] = len(slots)
+
+            if not slots:
+                del self.cells[cell]
+
+
+    def query(self, rect):
+        """Get the slots placed in the cells a rect overlaps."""
+        i_min = max(rect.left // self.tile_size, 0)
+        j_min = max(rect.top // self.tile_size, 0)
+        i_max = min((rect.right - 1) // self.tile_size, self.shape[0] - 1)
+        j_max = min((rect.bottom - 1) // self.tile_size, self.shape[1] - 1)
+
+        cells = self.cells
+        for i in range(i_min, i_max + 1):
+            for j in range(j_min, j_max + 1):
+                if (i, j) in cells:
+                    yield from cells[i, j]
+
+
 class ObjectManager:
     """Object rendering manager."""
-    def __init__(self, cfg=None):
+    def __init__(self, cfg=None, seed=None, size=None, capacity=None, soft_limit=None):
         self.cfg = cfg
 
-        # object rendering lists
+        # world size in pixels, the screen unless a map says otherwise
+        self.size = size or (cfg.display.screen_width, cfg.display.screen_height)
+
+        # slots double when they run out, optional objects are rejected above the soft limit
+        capacity = capacity or cfg.core.object_limit
+        self.min_capacity = capacity
+        self.soft_limit = soft_limit or cfg.core.soft_object_limit
+        self.metrics = {'capacity': capacity, 'peak': 0, 'grows': 0, 'shrinks': 0, 'over_soft_limit': 0,
+                        'rejected': 0}
+
+        # random number generator for item drops, seeded per match
+        self.rng = np.random.default_rng(seed)
+
+        # object rendering lists, the render list maps slots to objects
         self.render_buffer = list()
-        self.render_list = OrderedDict()
+        self.render_list = dict()
+
+        # object positions, vectors and lifespans, indexed by slot
+        self.store = EntityStore(capacity)
 
-        # object lifespan lists
-        self.lifespan_counts = np.zeros(self.cfg.core.object_limit + 1)
-        self.lifespan_limits = np.repeat(np.inf, self.cfg.core.object_limit + 1)
+        # slot allocator, generations invalidate handles to reused slots
+        self.generations = np.zeros(capacity, dtype=np.int64)
+        self.free_slots = list(range(capacity - 1, -1, -1))
 
         self.object_counts = 0
 
+        # walls of the map template take the first slots, killed walls by slot
+        self.n_walls = 0
+        self.killed_walls = dict()
+
+        # objects and tile grids of objects by exact type
+        self.type_lists = dict()
+        self.spatial_indices = dict()
+
+        # static objects are drawn once to a cached layer
+        self.dynamic_list = dict()
+        self.static_layer = None
+
+        # optional profiler, see profiler.py
+        self.profiler = None
+
+        # objects notified of linked and unlinked objects, see bots.py
+        self.observers = list()
+
+        # seconds since the match started
+        self.time = 0.
+
+        # last drawn sprite and text per slot, for dirty rect rendering
+        self.track_dirty = False
+        self.drawn_states = dict()
+        self.dirty_rects = list()
+
         # player pointers
         self.players = PlayerContainer(cfg)
 
 
     def add(self, objs):
         """Adds objects to the render list and update lifespans."""
-        # set player pointers
+        # set player pointers, the first free pointer gets the player
         if isinstance(objs, objects.Player):
-            # set pointers to default players
-            if not self.players.player_1:
-                self.players.player_1 = objs
-            elif not self.players.player_2:
-                self.players.player_2 = objs
-
-            # set pointers to optional additional players
-            if hasattr(self.players, 'player_3') and not self.player_3:
-                self.players.player_3 = objs
-            elif hasattr(self.players, 'player_4') and not self.player_4:
-                self.players.player_4 = objs
+            for i in range(1, self.cfg.core.no_players + 1):
+                if not self.players[i]:
+                    setattr(self.players, f'player_{i}', objs)
+                    break
 
         if not isinstance(objs, list):
             objs = [objs]
 
         # add objects
         for obj in objs:
-            if self.object_counts >= self.cfg.core.object_limit:
-                return
+            if not self.free_slots:
+                self.resize(2 * self.store.capacity)
+
+            if self.object_counts >= self.soft_limit:
+                self.metrics['over_soft_limit'] += 1
+
+            slot = self.free_slots.pop()
+
+            self.render_list[slot] = obj
+
+            obj.slot = slot
+            obj.handle = int(self.generations[slot]) << 32 | slot
+
+            self.store.bind(slot, obj)
+            self.link(slot, obj)
+
+        self.metrics['peak'] = max(self.metrics['peak'], self.object_counts)
+
+
+    @property
+    def pressure(self):
+        """Number of objects relative to the soft limit."""
+        return self.object_counts / self.soft_limit
+
+
+    def resize(self, capacity):
+        """Reallocate the store for capacity slots, the slots above capacity have to be free."""
+        store = self.store
+        old_capacity = store.capacity
+
+        store.resize(capacity)
+
+        # generations never shrink, handles to dropped slots stay invalid when they come back
+        if len(self.generations) < capacity:
+            self.generations = np.concatenate([self.generations,
+                                               np.zeros(capacity - len(self.generations), dtype=np.int64)])
+
+        if capacity > old_capacity:
+            self.free_slots += range(capacity - 1, old_capacity - 1, -1)
+            self.metrics['grows'] += 1
+        else:
+            self.free_slots = [slot for slot in self.free_slots if slot < capacity]
+            self.metrics['shrinks'] += 1
+
+        self.metrics['capacity'] = capacity
+
+        # vectors still view the old columns
+        for slot, obj in self.render_list.items():
+            store.attach(slot, obj)
+
+
+    def shrink(self):
+        """Halve the slots while at most a quarter is used and the upper half is free."""
+        capacity = self.store.capacity
+        alive = np.flatnonzero(self.store.alive)
+        top = alive[-1] + 1 if len(alive) else 0
+
+        while capacity // 2 >= max(self.min_capacity, top) and self.object_counts <= capacity // 4:
+            capacity //= 2
+
+        if capacity < self.store.capacity:
+            self.resize(capacity)
+
+
+    def link(self, slot, obj):
+        """Add an object in a slot to the type lists, grids and layers."""
+        self.type_lists.setdefault(type(obj), dict())[slot] = obj
+
+        if obj.indexed:
+            spatial_index = self.get_spatial_index(type(obj))
+            obj.cell = spatial_index.cell(obj.position)
+            spatial_index.insert(slot, obj.cell)
+
+        # patch static layer or draw every frame
+        if not obj.static:
+            self.dynamic_list[slot] = obj
+        elif self.static_layer:
+            obj.draw(self.static_layer, self)
+
+        self.object_counts += 1
 
-            self.render_list[self.object_counts] = obj
-            self.lifespan_limits[self.object_counts] = obj.lifespan
+        for observer in self.observers:
+            observer.on_link(obj)
 
-            self.object_counts += 1
 
+    def unlink(self, slot, obj):
+        """Remove an object in a slot from the type lists, grids and layers."""
+        self.type_lists[type(obj)].pop(slot)
 
-    def kill(self, idx):
-        """Removes object from render list and lifespan lists."""
-        # remove and shift elements based on index
-        self.lifespan_counts[idx:-1] = self.lifespan_counts[idx + 1:]
-        self.lifespan_counts[-1] = 0
+        if obj.indexed:
+            self.spatial_indices[type(obj)].remove(slot, obj.cell)
 
-        self.lifespan_limits[idx:-1] = self.lifespan_limits[idx + 1:]
-        self.lifespan_limits[-1] = np.inf
+        if not obj.static:
+            self.dynamic_list.pop(slot)
+        elif self.static_layer:
+            self.clear_static_tile(obj.sprite)
 
-        self.render_list[idx].on_kill(self)
-        self.render_list.pop(idx)
+        # region of the removed object has to be redrawn
+        if self.track_dirty:
+            drawn = self.drawn_states.pop(slot, None)
+            if drawn:
+                self.dirty_rects.append(pg.Rect(drawn[0]))
+            elif obj.static:
+                self.dirty_rects.append(obj.sprite.copy())
 
         self.object_counts -= 1
 
-    
-    def draw_all(self, screen):
-        """Draw all objects to screen."""
-        # draw all objects as ordered in the render list
+        for observer in self.observers:
+            observer.on_unlink(obj)
+
+
+    def get(self, handle):
+        """Get object by handle, None if the object has been killed."""
+        slot = handle & 0xffffffff
+
+        if self.generations[slot] != handle >> 32:
+            return None
+
+        return self.render_list.get(slot)
+
+
+    def set_lifespan(self, obj, lifespan):
+        """Set the lifespan of an object in the render list."""
+        obj.lifespan = lifespan
+        self.store.lifespan_limits[obj.slot] = lifespan
+
+
+    def snapshot(self):
+        """Capture the world state, sharing object references with the world.
+
+        Walls of the map template only change when killed, the slots of live walls are not copied.
+        """
+        n = self.n_walls
+        killed = list(self.killed_walls)
+
+        return WorldState(columns={name: getattr(self.store, name)[n:].copy() for name in EntityStore.columns},
+                          generations=self.generations[n:].copy(),
+                          wall_columns={name: getattr(self.store, name)[killed] for name in EntityStore.columns},
+                          wall_generations=self.generations[killed],
+                          killed_walls=self.killed_walls.copy(),
+                          free_slots=self.free_slots.copy(),
+                          render_list=self.dynamic_list.copy(),
+                          render_buffer=self.render_buffer.copy(),
+                          rng_state=self.rng.bit_generator.state,
+                          time=self.time,
+                          states={slot: obj.get_state() for cls, type_list in self.type_lists.items() if cls.state_attrs
+                                                        for slot, obj in type_list.items()})
+
+
+    def restore(self, state):
+        """Return to a captured world state, relinking only changed slots."""
+        store = self.store
+        n = self.n_walls
+        capacity = n + len(state.columns['alive'])
+
+        if store.capacity < capacity:
+            self.resize(capacity)
+
+        # slots of walls killed since the snapshot or alive again since, walls alive at the snapshot come back
+        changed = sorted(self.killed_walls.keys() ^ state.killed_walls.keys())
+        revived = {slot: self.killed_walls[slot] for slot in changed if slot not in state.killed_walls}
+
+        # slots of walls killed before the snapshot compare like the other slots
+        killed = list(state.killed_walls)
+        kept = np.array([slot in self.killed_walls for slot in killed], dtype=bool)
+        slots = np.array(killed, dtype=np.int64)[kept]
+        changed += slots[(self.generations[slots] != state.wall_generations[kept]) |
+                         (store.alive[slots] != state.wall_columns['alive'][kept])].tolist()
+
+        # other slots killed or filled since the snapshot, slots added since are killed
+        changed += (np.flatnonzero((self.generations[n:capacity] != state.generations[:capacity - n]) |
+                                          (store.alive[n:capacity] != state.columns['alive'])) + n).tolist()
+        changed += (np.flatnonzero(store.alive[capacity:]) + capacity).tolist()
+
+        for slot in changed:
+            obj = self.render_list.pop(slot, None)
+            if obj:
+                self.unlink(slot, obj)
+                store.unbind(slot, obj)
+                obj.slot = None
+
+        if store.capacity > capacity:
+            self.resize(capacity)
+
+        # copy columns and allocator back
+        for name, column in state.columns.items():
+            np.copyto(getattr(store, name)[n:], column)
+
+        self.generations[n:n + len(state.generations)] = state.generations
+
+        # walls live as long as the world, killed wall slots are copied back
+        for slot, wall in revived.items():
+            store.bind(slot, wall)
+            store.movements[slot] = 0
+            store.lifespan_limits[slot] = np.inf
+            self.generations[slot] = wall.handle >> 32
+
+        store.lifespan_counts[:n] = state.time
+
+        for name, rows in state.wall_columns.items():
+            getattr(store, name)[killed] = rows
+
+        self.generations[killed] = state.wall_generations
+        self.killed_walls = state.killed_walls.copy()
+
+        # no interpolation across a restore
+        np.copyto(store.previous, store.positions)
+        self.free_slots = state.free_slots.copy()
+        self.render_buffer = state.render_buffer.copy()
+        self.rng.bit_generator.state = state.rng_state
+        self.time = state.time
+
+        for slot in changed:
+            obj = state.render_list.get(slot) or revived.get(slot)
+            if obj:
+                self.render_list[slot] = obj
+
+                obj.slot = slot
+                obj.handle = int(self.generations[slot]) << 32 | slot
+                obj.lifespan = float(store.lifespan_limits[slot])
+
+                store.attach(slot, obj)
+                self.link(slot, obj)
+
+        for slot, obj_state in state.states.items():
+            self.render_list[slot].set_state(obj_state)
+
+        # players are the only objects moved outside the store
+        for player in self.players:
+            player.sprite.topleft = player.position
+            self.move(player)
+
+
+    def get_spatial_index(self, cls):
+        """Get the tile grid of objects of a type."""
+        if cls not in self.spatial_indices:
+            self.spatial_indices[cls] = SpatialIndex(self.size, self.cfg.display.tile_size)
+
+        return self.spatial_indices[cls]
+
+
+    def move(self, obj):
+        """Update the cell of an object after its position changed."""
+        spatial_index = self.spatial_indices[type(obj)]
+        cell = spatial_index.cell(obj.position)
+
+        if cell != obj.cell:
+            spatial_index.remove(obj.slot, obj.cell)
+            spatial_index.insert(obj.slot, cell)
+            obj.cell = cell
+
+
+    def kill(self, slot):
+        """Removes object from render list and frees its slot."""
+        obj = self.render_list.pop(slot)
+
+        # only walls are static, their slots are copied by snapshots from now on
+        if obj.static:
+            self.killed_walls[slot] = obj
+
+        # invalidate handles to the slot
+        self.generations[slot] += 1
+        self.free_slots.append(slot)
+
+        self.unlink(slot, obj)
+
+        obj.on_kill(self)
+
+        self.store.unbind(slot, obj)
+        obj.slot = None
+
+
+    def bake_static_layer(self, size):
+        """Draw all static objects to a cached layer."""
+        self.static_layer = pg.Surface(size)
+        self.static_layer.fill(self.cfg.colors.background_color)
+
         for obj in self.render_list.values():
-            obj.draw(screen, self)
+            if obj.static:
+                obj.draw(self.static_layer, self)
+
+
+    def clear_static_tile(self, rect):
+        """Clear a tile of the static layer and redraw what remains there."""
+        self.static_layer.fill(self.cfg.colors.background_color, rect)
+
+        static_types = tuple(cls for cls in self.spatial_indices if cls.static)
+
+        for obj in self.get_colliding_objects(rect, *static_types):
+            obj.draw(self.static_layer, self)
+
+    
+    def interpolate(self, slots, alpha):
+        """Get draw offsets of objects that moved this tick, alpha of the way from the previous position."""
+        slots = np.fromiter(slots, dtype=np.int64)
+        delta = self.store.previous[slots] - self.store.positions[slots]
+        moved = np.any(delta != 0, axis=1)
+
+        offsets = np.rint(delta[moved] * (1 - alpha)).astype(int)
+
+        return dict(zip(slots[moved].tolist(), map(tuple, offsets.tolist())))
+
+
+    def draw_all(self, screen, alpha=1.):
+        """Draw static layer and dynamic objects to screen, interpolated between ticks by alpha."""
+        if not self.static_layer:
+            self.bake_static_layer(screen.get_size())
+
+        # static layer covers the background
+        screen.blit(self.static_layer, (0, 0))
+
+        offsets = self.interpolate(self.dynamic_list, alpha) if alpha < 1 else dict()
+
+        # draw dynamic objects as ordered in the render list
+        if self.profiler:
+            self.draw_profiled(screen, offsets)
+        else:
+            for slot, obj in self.dynamic_list.items():
+                obj.draw(screen, self, offsets.get(slot))
+
+
+    def draw_profiled(self, screen, offsets=None):
+        """Draw dynamic objects, timing the draw calls per object type."""
+        durations = dict()
+        offsets = offsets or dict()
+
+        for slot, obj in self.dynamic_list.items():
+            start = time.perf_counter_ns()
+            obj.draw(screen, self, offsets.get(slot))
+            name = f'draw.{type(obj).__name__}'
+            durations[name] = durations.get(name, 0) + time.perf_counter_ns() - start
+
+        for name, duration in durations.items():
+            self.profiler.add(name, duration)
+
+
+    def draw_dirty(self, screen):
+        """Redraw only changed regions of the screen and return them, without interpolation."""
+        if not self.track_dirty:
+            self.bake_static_layer(screen.get_size())
+            self.track_dirty = True
+            self.dirty_rects = [screen.get_rect()]
+
+        # find objects that moved, spawned or changed text since last drawn
+        dirty_rects = self.dirty_rects
+        self.dirty_rects = list()
+
+        for slot, obj in self.dynamic_list.items():
+            obj.refresh(self)
+            state = (tuple(obj.sprite), obj.text)
+            drawn = self.drawn_states.get(slot)
+
+            if state != drawn:
+                if drawn:
+                    dirty_rects.append(pg.Rect(drawn[0]))
+                dirty_rects.append(obj.sprite.copy())
+                self.drawn_states[slot] = state
+
+        # restore static layer and redraw overlapping objects per region
+        objs = list(self.dynamic_list.values())
+        sprites = [obj.sprite for obj in objs]
+
+        for rect in dirty_rects:
+            screen.set_clip(rect)
+            screen.blit(self.static_layer, rect, rect)
+            for idx in rect.collidelistall(sprites):
+                objs[idx].draw(screen, self)
+
+        screen.set_clip(None)
+
+        return dirty_rects
 
 
     def update(self):
         """Update object status, called every frame."""
         # add objects from buffer and clear buffer
-        self.add(self.render_buffer)
-        self.render_buffer.clear()
+        if self.render_buffer:
+            self.add(self.render_buffer)
+            self.render_buffer.clear()
 
-        # update and increment lifespan counts
-        lifespans = [obj.lifespan for obj in self.render_list.values()]
-        self.object_counts = len(lifespans)
-        
-        self.lifespan_limits[:self.object_counts] = lifespans
-        self.lifespan_counts[:self.object_counts] += 1 / self.cfg.display.refresh_rate
+        # increment lifespan counts, free slots never expire
+        store = self.store
+        store.lifespan_counts += 1 / self.cfg.core.tick_rate
+        self.time += 1 / self.cfg.core.tick_rate
 
         # if lifespan > lifespan limit, remove object(s)
-        to_kill = np.where(self.lifespan_counts > self.lifespan_limits)[0]
+        np.greater(store.lifespan_counts, store.lifespan_limits, out=store.expired)
+
+        if store.expired.any():
+            slots = [int(slot) for slot in np.flatnonzero(store.expired)]
+
+            # detonate expired bombs together, chained bombs die this tick too
+            bombs = [self.render_list[slot] for slot in slots if isinstance(self.render_list[slot], objects.Bomb)]
+
+            if bombs:
+                start = time.perf_counter_ns()
+                slots += [bomb.slot for bomb in self.detonate(bombs) if bomb.slot not in slots]
+
+                if self.profiler:
+                    self.profiler.add('update.detonate', time.perf_counter_ns() - start)
+
+            for slot in slots:
+                self.kill(slot)
+
+            if self.cfg.core.shrink_objects:
+                self.shrink()
+
+
+    def detonate(self, bombs):
+        """Create explosions of bombs in one pass, returns bombs caught in the blasts."""
+        solid = self.get_spatial_index(objects.SolidWall).counts > 0
+        breakable = self.get_spatial_index(objects.BreakableWall).counts > 0
+        bomb_index = self.get_spatial_index(objects.Bomb)
+
+        for bomb in bombs:
+            bomb.detonated = True
+
+        chained = []
+        explosions = []
+
+        while bombs:
+            centers = np.array([bomb.cell for bomb in bombs])
+            radii = np.array([bomb.radius for bomb in bombs])
+
+            # one explosion per bomb center and per reached cell
+            owners, blast = blast_cells(centers, radii, solid, breakable)
+
+            for owner, cell in zip(owners.tolist(), blast.tolist()):
+                explosions.append(objects.Explosion(Vec2D(cell) * self.cfg.display.tile_size,
+                                                    player=bombs[owner].player,
+                                                    color=self.cfg.colors.explosion_color,
+                                                    tile_size=self.cfg.display.tile_size))
+
+            # bombs in blast cells detonate in the same pass
+            bombs = []
+            for cell in blast[bomb_index.counts[blast[:, 0], blast[:, 1]] > 0].tolist():
+                for slot in bomb_index.at(cell):
+                    bomb = self.render_list[slot]
+                    if not bomb.detonated:
+                        bomb.detonated = True
+                        bombs.append(bomb)
+
+            chained += bombs
+
+        self.render_buffer += explosions
+
+        return chained
+
+
+    def get_colliding_objects(self, sprite, *args):
+        """Get grid aligned objects colliding with a sprite, in slot order."""
+        slots = []
+
+        for cls, spatial_index in self.spatial_indices.items():
+            if issubclass(cls, args):
+                slots += spatial_index.query(sprite)
+
+        return [self.render_list[slot] for slot in sorted(slots)
+                if sprite.colliderect(self.render_list[slot].sprite)]
+
+
+    def broad_phase(self):
+        """Find all colliding objects once, keyed by (layer bit, layer bit) of the objects and their mask.
+
+        Only types with a mask query the grid, for every bit of their mask; each key maps to
+        (object, colliding objects in slot order) pairs. Types on several layers are found under
+        every bit of their layer.
+        """
+        pairs = dict()
+
+        for cls, type_list in self.type_lists.items():
+            if not cls.mask or not type_list:
+                continue
+
+            layer_bits = [1 << i for i in range(cls.layer.bit_length()) if cls.layer >> i & 1]
+
+            bit = 1
+            while bit <= cls.mask:
+                if cls.mask & bit:
+                    others = tuple(other for other in self.spatial_indices if other.layer & bit)
+                    found = []
+
+                    for obj in type_list.values():
+                        colliding = self.get_colliding_objects(obj.sprite, *others) if others else None
+                        if colliding:
+                            found.append((obj, colliding))
+
+                    for layer_bit in layer_bits:
+                        pairs.setdefault((layer_bit, bit), []).extend(found)
+                bit <<= 1
 
-        for idx in to_kill:
-            self.kill(idx)
+        return pairs
 
-        self.lifespan_counts[self.object_counts:] = 0
-        self.lifespan_limits[self.object_counts:] = np.inf
 
-        # reset index
-        self.render_list = dict(zip(range(self.object_counts), self.render_list.values()))
+class Camera:
+    """Viewport on a world larger than the screen, draws only the objects in view."""
+    def __init__(self, object_manager, size):
+        self.object_manager = object_manager
+        self.rect = pg.Rect((0, 0), size)
+
+
+    def follow(self, position):
+        """Center the view on a world position, kept inside the world."""
+        self.rect.center = position
+        self.rect.clamp_ip(pg.Rect((0, 0), self.object_manager.size))
+
+
+    def draw(self, screen, alpha=1.):
+        """Draw the objects in view, static objects first, then the rest in slot order."""
+        object_manager = self.object_manager
+        offset = (-self.rect.x, -self.rect.y)
+
+        screen.fill(self.object_manager.cfg.colors.background_color)
+
+        # objects are indexed by their top left corner, look one tile further
+        tile_size = object_manager.cfg.display.tile_size
+        view = self.rect.inflate(2 * tile_size, 2 * tile_size)
+
+        dynamic = []
+        for cls, spatial_index in object_manager.spatial_indices.items():
+            if cls.static:
+                for slot in spatial_index.query(view):
+                    object_manager.render_list[slot].draw(screen, object_manager, offset)
+            else:
+                dynamic += spatial_index.query(view)
 
+        dynamic.sort()
+        offsets = object_manager.interpolate(dynamic, alpha) if alpha < 1 else dict()
 
-    def get_objects_sprites(self, *args):
-        """Get objects and sprites from render list."""
-        objects = [object for object in self.render_list.values() if isinstance(object, args)]
-        sprites = [object.sprite for object in objects]
+        for slot in dynamic:
+            dx, dy = offsets.get(slot, (0, 0))
+            object_manager.render_list[slot].draw(screen, object_manager, (offset[0] + dx, offset[1] + dy))
 
-        return objects, sprites
+        # objects off the tile grid are drawn in screen coordinates
+        for obj in object_manager.dynamic_list.values():
+            if not obj.indexed:
+                obj.draw(screen, object_manager)
 
 
 class actions:
@@ -214,6 +1068,28 @@ class ActionManager:
         self.cfg = cfg
         self.object_manager = object_manager
 
+        # collision callbacks by (layer, layer bit), called in registration order
+        self.collision_handlers = dict()
+
+        self.register_collision(objects.layers.PLAYER, objects.layers.WALL, self.on_player_wall)
+        self.register_collision(objects.layers.PLAYER, objects.layers.ITEM, self.on_player_item)
+        self.register_collision(objects.layers.EXPLOSION, objects.layers.BREAKABLE, self.on_explosion_breakable)
+
+
+    def register_collision(self, layer, other, callback):
+        """Call callback(obj, others) for objects on a layer bit colliding with objects on another layer bit.
+
+        The other layer has to be in the mask of the colliding type.
+        """
+        self.collision_handlers.setdefault((layer, other), []).append(callback)
+
+
+    def request_bomb(self, player):
+        """Queue a bomb drop if the player has bombs left."""
+        if player.n_bombs > 0:
+            player.action_buffer.append(actions.DROP_BOMB)
+            player.n_bombs -= 1
+
 
     def handle_player_movement(self):
         """Defines player movement constraints."""
@@ -221,26 +1097,33 @@ class ActionManager:
         object_manager = self.object_manager
 
         # out of bounds constraints
-        max_x = self.cfg.display.screen_width - self.cfg.display.tile_size
-        max_y = self.cfg.display.screen_height - self.cfg.display.tile_size
+        max_x = object_manager.size[0] - self.cfg.display.tile_size
+        max_y = object_manager.size[1] - self.cfg.display.tile_size
+
+        players = list(object_manager.players)
+        slots = np.array([player.slot for player in players])
 
-        for player in object_manager.players:   
-            # player object can only move in grid-like pattern
-            if all(player.position % self.cfg.display.tile_size == 0):
-                player.vector = player.movement_buffer.copy()
+        if not len(slots):
+            return
 
-            # move player object
-            player.position += player.vector
+        store = object_manager.store
+        positions = store.positions[slots]
 
-            if player.position.x < 0: 
-                player.position.x = 0
-            if player.position.x > max_x: 
-                player.position.x = max_x
+        # player object can only move in grid-like pattern, speed changes on the grid too
+        aligned = np.all(positions % self.cfg.display.tile_size == 0, axis=1)
+        speeds = np.array([[player.n_speed] for player in players], dtype=store.vectors.dtype)
+        store.vectors[slots[aligned]] = store.movements[slots[aligned]] * speeds[aligned]
 
-            if player.position.y < 0: 
-                player.player.position.y = 0
-            if player.position.y > max_y: 
-                player.player.position.y = max_y
+        # move player objects
+        positions += store.vectors[slots]
+        np.clip(positions, 0, (max_x, max_y), out=positions)
+
+        store.positions[slots] = positions
+
+        # keep sprites and cells in sync for headless collision checks
+        for player in players:
+            player.sprite.topleft = player.position
+            object_manager.move(player)
 
 
     def handle_player_actions(self):
@@ -253,67 +1136,57 @@ class ActionManager:
             if actions.DROP_BOMB in player.action_buffer:
                 # drop bomb behind player
                 position = player.position.copy()
-                if player.vector.y == -1: 
+                if player.vector.y < 0: 
                     position.y = self.cfg.display.tile_size * np.ceil(position.y / self.cfg.display.tile_size)
-                if player.vector.y == 1: 
+                if player.vector.y > 0: 
                     position.y = self.cfg.display.tile_size * np.floor(position.y / self.cfg.display.tile_size)
-                if player.vector.x == -1: 
+                if player.vector.x < 0: 
                     position.x = self.cfg.display.tile_size * np.ceil(position.x / self.cfg.display.tile_size)
-                if player.vector.x == 1: 
+                if player.vector.x > 0: 
                     position.x = self.cfg.display.tile_size * np.floor(position.x / self.cfg.display.tile_size)
 
                 # drop bomb
                 object_manager.add(objects.Bomb(position,
                                                 player=player,
-                                                color=self.cfg.colors.bomb_color))
+                                                color=self.cfg.colors.bomb_color,
+                                                tile_size=self.cfg.display.tile_size))
                 player.action_buffer.remove(actions.DROP_BOMB)
 
 
-    def handle_player_collisions(self):
-        """Handles coliisions between player and other objects."""
-        # refresh
-        object_manager = self.object_manager
+    def handle_collisions(self):
+        """Handles collisions of all layer pairs from a single broad phase."""
+        pairs = self.object_manager.broad_phase()
 
-        # player - wall interactions
-        _, sprites = object_manager.get_objects_sprites(objects.SolidWall, objects.BreakableWall)
+        for key, callbacks in self.collision_handlers.items():
+            for obj, others in pairs.get(key, ()):
+                for callback in callbacks:
+                    callback(obj, others)
 
-        for player in object_manager.players:
-            idx = player.sprite.collidelist(sprites)
 
-            if idx >= 0:
-                wall = sprites[idx]
-                if player.vector.y > 0: 
-                    player.position.y = wall.y - self.cfg.display.tile_size
-                if player.vector.y < 0: 
-                    player.position.y = wall.y + self.cfg.display.tile_size
-                if player.vector.x > 0: 
-                    player.position.x = wall.x - self.cfg.display.tile_size
-                if player.vector.x < 0: 
-                    player.position.x = wall.x + self.cfg.display.tile_size
+    def on_player_wall(self, player, walls):
+        """Push the player out of the first wall it walked into."""
+        wall = walls[0].sprite
+        if player.vector.y > 0: 
+            player.position.y = wall.y - self.cfg.display.tile_size
+        if player.vector.y < 0: 
+            player.position.y = wall.y + self.cfg.display.tile_size
+        if player.vector.x > 0: 
+            player.position.x = wall.x - self.cfg.display.tile_size
+        if player.vector.x < 0: 
+            player.position.x = wall.x + self.cfg.display.tile_size
 
-        # player - item interactions
-        items, sprites = object_manager.get_objects_sprites(objects.Item)
+        player.sprite.topleft = player.position
+        self.object_manager.move(player)
 
-        for player in object_manager.players:
-            idx = player.sprite.collidelist(sprites)
 
-            if idx >= 0:
-                items[idx].lifespan = 0
+    def on_player_item(self, player, items):
+        """Pick up the first item, it is applied when it expires."""
+        items[0].player = player
+        self.object_manager.set_lifespan(items[0], 0)
 
-        
-    def handle_explosion_collisions(self):
-        """Handles collisions between explosions and other objects."""
-        # refresh
-        object_manager = self.object_manager
-        
-        # explosion - breakable wall interactions
-        walls, sprites = object_manager.get_objects_sprites(objects.SolidWall, objects.BreakableWall)
-        explosions, _ = object_manager.get_objects_sprites(objects.Explosion)
-
-        for explosion in explosions:
-            idxs = explosion.sprite.collidelistall(sprites)
-            for idx in idxs:
-                wall = walls[idx]
-                if isinstance(wall, objects.BreakableWall):
-                    wall.lifespan = 0
-                    explosion.player.n_score += 5
+
+    def on_explosion_breakable(self, explosion, walls):
+        """Break walls in the explosion and score them for the bomb owner."""
+        for wall in walls:
+            self.object_manager.set_lifespan(wall, 0)
+            explosion.player.n_score += 5
@@ -0,0 +1,175 @@
+import re
+
+from collections import deque
+
+import numpy as np
+import pygame as pg
+
+
+# columns and values an action writes into the (dx, dy, drop bomb) row of a player
+ACTIONS = {'up': (slice(0, 2), (0, -1)),
+           'down': (slice(0, 2), (0, 1)),
+           'left': (slice(0, 2), (-1, 0)),
+           'right': (slice(0, 2), (1, 0)),
+           'drop_bomb': (2, 1)}
+
+# movement starts on key press, bombs drop on release
+TRIGGERS = {'up': pg.KEYDOWN, 'down': pg.KEYDOWN, 'left': pg.KEYDOWN, 'right': pg.KEYDOWN,
+            'drop_bomb': pg.KEYUP}
+
+# player controls are named k_p<player>_<action>
+CONTROL = re.compile(r'k_p(\d+)_(\w+)')
+
+
+def compile_controls(cfg, players=None):
+    """Map (event type, key) to (player index, action) for the controls of the given or all players."""
+    table = dict()
+
+    for name, key in vars(cfg.controls).items():
+        match = CONTROL.fullmatch(name)
+        if not match or match[2] not in ACTIONS:
+            continue
+
+        player = int(match[1]) - 1
+        if players is None or player in players:
+            table[(TRIGGERS[match[2]], key)] = (player, match[2])
+
+    return table
+
+
+class KeyboardSource:
+    """Turns key events into inputs through a compiled control table."""
+    def __init__(self, cfg, players=None):
+        self.table = compile_controls(cfg, players)
+
+
+    def handle(self, event, tick, queue):
+        """Queue the input bound to a key event, if any."""
+        if event.type in (pg.KEYDOWN, pg.KEYUP):
+            binding = self.table.get((event.type, event.key))
+
+            if binding:
+                queue.push(tick, *binding)
+
+
+    def poll(self, tick, queue):
+        """Keys only arrive as events."""
+        pass
+
+
+class GamepadSource:
+    """Turns hat and button events of one gamepad into inputs of a player."""
+    # hat y points up
+    hat_actions = {(0, 1): 'up', (0, -1): 'down', (-1, 0): 'left', (1, 0): 'right'}
+
+    def __init__(self, player, instance_id, cfg=None):
+        self.player = player
+        self.instance_id = instance_id
+        self.drop_button = cfg.controls.gamepad_drop_bomb
+
+
+    def handle(self, event, tick, queue):
+        """Queue the input of a hat or button event of this gamepad."""
+        if getattr(event, 'instance_id', None) != self.instance_id:
+            return
+
+        if event.type == pg.JOYHATMOTION and event.value in self.hat_actions:
+            queue.push(tick, self.player, self.hat_actions[event.value])
+        elif event.type == pg.JOYBUTTONUP and event.button == self.drop_button:
+            queue.push(tick, self.player, 'drop_bomb')
+
+
+    def poll(self, tick, queue):
+        """Gamepads only arrive as events."""
+        pass
+
+
+class ScriptSource:
+    """Plays per-tick (n_ticks, n_players, 3) action rows, e.g. of a replay."""
+    def __init__(self, actions, players=None):
+        self.actions = np.asarray(actions, dtype=np.int8)
+        self.players = range(self.actions.shape[1]) if players is None else players
+
+
+    def handle(self, event, tick, queue):
+        """Scripts ignore events."""
+        pass
+
+
+    def poll(self, tick, queue):
+        """Queue the rows of a tick, the script holds its last row when it runs out."""
+        row = self.actions[min(tick, len(self.actions) - 1)]
+
+        for player in self.players:
+            queue.push_row(tick, player, row[player])
+
+
+class PolicySource:
+    """Asks a policy for the rows of some players every tick, for bots and network players."""
+    def __init__(self, policy, players):
+        self.policy = policy
+        self.players = players
+
+
+    def handle(self, event, tick, queue):
+        """Policies ignore events."""
+        pass
+
+
+    def poll(self, tick, queue):
+        """Queue policy(tick) rows, one per player."""
+        for player, row in zip(self.players, self.policy(tick)):
+            queue.push_row(tick, player, row)
+
+
+class InputQueue:
+    """Tick stamped inputs from any number of sources, folded into per-player action rows."""
+    def __init__(self, n_players, sources=()):
+        self.sources = list(sources)
+
+        # (tick, player, columns, values) in arrival order, sources stamp ticks in order
+        self.events = deque()
+
+        # per-player (dx, dy, drop bomb) rows
+        self.actions = np.zeros((n_players, 3), dtype=np.int8)
+
+
+    def push(self, tick, player, action):
+        """Queue a named action of a player for a tick."""
+        if player < len(self.actions):
+            self.events.append((tick, player, *ACTIONS[action]))
+
+
+    def push_row(self, tick, player, row):
+        """Queue a full (dx, dy, drop bomb) row of a player for a tick."""
+        if player < len(self.actions):
+            self.events.append((tick, player, slice(None), row))
+
+
+    def handle(self, event, tick):
+        """Pass an event to every source."""
+        for source in self.sources:
+            source.handle(event, tick, self)
+
+
+    def poll(self, tick):
+        """Let every source queue its inputs for a tick."""
+        for source in self.sources:
+            source.poll(tick, self)
+
+
+    def pop(self, tick):
+        """Apply the inputs due by a tick, returns the action rows."""
+        events = self.events
+        actions = self.actions
+
+        while events and events[0][0] <= tick:
+            _, player, columns, values = events.popleft()
+            actions[player, columns] = values
+
+        return actions
+
+
+    def consume(self):
+        """Bomb drops only last a single tick."""
+        self.actions[:, 2] = 0
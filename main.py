@@ -1,90 +1,123 @@
+import argparse
+import contextlib
 import os
+import time
 
 import numpy as np
 import pygame as pg
 
 import assets.objects as objects
+import mapgen
 
-from assets.objects import Vec2D
+from assets.objects import Vec2D, load_font
 from config import config as cfg
 from core import *
+from inputs import GamepadSource, InputQueue, KeyboardSource
+from profiler import Profiler
+from recorder import FrameRecorder
+from replay import InputRecorder
+from session import GameSession
 
 
 if __name__ == '__main__':
-    # init pygame
-    pg.init()
-
-    # init fonts
-    load_fonts(cfg)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--map', default=None, help='map to play on, see mapgen.py')
+    parser.add_argument('--seed', type=int, default=None, help='seed for item drops')
+    parser.add_argument('--record', default=None, help='record player inputs to a replay file')
+    parser.add_argument('--capture', default=None, help='record frames to a GIF file, see recorder.py')
+    parser.add_argument('--profile', default=None, help='write per-phase timings to a JSON file on exit')
+    parser.add_argument('--overlay', action='store_true', help='draw per-phase timings on screen')
+    args = parser.parse_args()
+
+    # other maps spawn players in their corners
+    if args.map:
+        grid_shape = np.load(args.map, mmap_mode='r').shape
+        spawn_positions = mapgen.spawn_positions(grid_shape, cfg.display.tile_size)
+    else:
+        args.map = os.path.join('assets', 'maps', 'test.npy')
+        spawn_positions = None
 
     # init game
     screen, clock, fps = init(cfg)
 
-    # load map
-    statics = load_map(os.path.join('assets', 'maps', 'test.npy'), cfg=cfg)
-
-    # init static objects
-    object_manager = ObjectManager(cfg=cfg)
-    object_manager.add(statics)
-
-    # init players
-    add_players(object_manager, cfg)
-
-    # init counters
-    add_counters(object_manager, cfg)
-
-    # init action manager
-    action_manager = ActionManager(object_manager, cfg=cfg)
-
-    # core loop
-    while True:
-        # events
-        for event in pg.event.get():
-            # quit the game
-            if event.type == pg.QUIT:
-                quit()
-            if event.type == pg.KEYDOWN:
-                # player 1 movement
-                for p in range(1, 3): # TODO: change to number of manually controlled players
-                    if event.key == getattr(cfg.controls, f'k_p{p}_up'):
-                        object_manager.players[p].movement_buffer.x = 0
-                        object_manager.players[p].movement_buffer.y = -1
-                    if event.key == getattr(cfg.controls, f'k_p{p}_down'):
-                        object_manager.players[p].movement_buffer.x = 0
-                        object_manager.players[p].movement_buffer.y = 1
-                    if event.key == getattr(cfg.controls, f'k_p{p}_left'):
-                        object_manager.players[p].movement_buffer.x = -1
-                        object_manager.players[p].movement_buffer.y = 0
-                    if event.key == getattr(cfg.controls, f'k_p{p}_right'):
-                        object_manager.players[p].movement_buffer.x = 1
-                        object_manager.players[p].movement_buffer.y = 0
-            if event.type == pg.KEYUP:
-                # drop bomb
-                for p in range(1, 3): # TODO: change to number of manually controlled players
-                    if event.key == getattr(cfg.controls, f'k_p{p}_drop_bomb'):
-                        if object_manager.players[p].n_bombs > 0:
-                            object_manager.players[p].action_buffer.append(actions.DROP_BOMB)
-                            object_manager.players[p].n_bombs -= 1
-
-        # handle player movement
-        action_manager.handle_player_movement()
-
-        # handle player actions
-        action_manager.handle_player_actions()
-
-        # handle collisions
-        action_manager.handle_player_collisions()
-        action_manager.handle_explosion_collisions()
-
-        # update
-        screen.fill(cfg.colors.background_color)
-
-        object_manager.draw_all(screen)
-        object_manager.update()
-
-        pg.display.flip()
-
-        # refresh rate
-        clock.tick(fps)
-
-    quit()
\ No newline at end of file
+    # optional timings of the core loop
+    profiler = Profiler() if args.profile or args.overlay else None
+    timed = profiler.phase if profiler else lambda name: contextlib.nullcontext()
+
+    # init session from map, including counters
+    session = GameSession(args.map, cfg=cfg, counters=True, seed=args.seed,
+                          profiler=profiler, spawn_positions=spawn_positions)
+
+    object_manager = session.object_manager
+    action_manager = session.action_manager
+
+    # human players share the keyboard, gamepads go to humans in order
+    humans = range(cfg.core.no_players - cfg.core.no_bots)
+    sources = [KeyboardSource(cfg, players=humans)]
+
+    pg.joystick.init()
+    for player, i in zip(humans, range(pg.joystick.get_count())):
+        sources.append(GamepadSource(player, pg.joystick.Joystick(i).get_instance_id(), cfg=cfg))
+
+    inputs = InputQueue(cfg.core.no_players, sources)
+
+    recorder = InputRecorder(args.record, session) if args.record else None
+    capture = FrameRecorder(args.capture, screen, cfg=cfg) if args.capture else None
+
+    # the simulation catches up with the time passed since the last frame
+    last_frame = time.perf_counter()
+
+    # core loop, logs, captures and timings are finished however the game ends
+    try:
+        while True:
+            # events
+            for event in pg.event.get():
+                # quit the game
+                if event.type == pg.QUIT:
+                    quit()
+
+                # inputs apply to the next tick
+                inputs.handle(event, session.tick)
+
+            inputs.poll(session.tick)
+
+            # handle movement, actions, collisions and lifespans at the fixed tick rate
+            now = time.perf_counter()
+            tick = session.tick
+            alpha = session.advance(now - last_frame, inputs.pop(tick))
+            last_frame = now
+
+            # bomb drops only last a single tick, frames without a tick keep them
+            if session.tick != tick:
+                inputs.consume()
+
+            # update, the overlay and the camera need full redraws
+            if cfg.display.dirty_rects and not args.overlay and not session.camera:
+                with timed('draw'):
+                    rects = object_manager.draw_dirty(screen)
+                with timed('display'):
+                    pg.display.update(rects)
+            else:
+                with timed('draw'):
+                    session.draw(screen, alpha)
+                    if args.overlay:
+                        profiler.draw(screen, load_font(*cfg.fonts.default_font), cfg.colors.item_text_color, position=(0, 32))
+                with timed('display'):
+                    pg.display.flip()
+
+            # frames are copied and encoded in the background
+            if capture:
+                with timed('capture'):
+                    capture.capture(screen, session.tick)
+
+            # refresh rate
+            clock.tick(fps)
+    finally:
+        if recorder:
+            recorder.close()
+        if capture:
+            capture.close()
+        if args.profile:
+            profiler.dump(args.profile)
+
+    quit()
@@ -0,0 +1,54 @@
+import argparse
+
+import numpy as np
+
+
+def spawn_cells(width, height):
+    """Cells of the four corners inside the outer wall, in player order."""
+    return [(1, 1), (width - 2, height - 2), (width - 2, 1), (1, height - 2)]
+
+
+def spawn_positions(grid_shape, tile_size):
+    """Screen positions of the spawn cells, map rows start one tile down."""
+    return [(i * tile_size, (j + 1) * tile_size) for i, j in spawn_cells(*grid_shape)]
+
+
+def generate(width, height, density=.5, seed=None, clearance=2):
+    """Seeded map with outer wall, pillars on even cells, breakable walls and clear spawns.
+
+    Every spawn cell keeps clearance free cells along the wall in both directions,
+    so a player can always drop a first bomb and step out of its blast.
+    """
+    if width < 2 * clearance + 3 or height < 2 * clearance + 3:
+        raise ValueError(f'map of {width}x{height} is too small for a spawn clearance of {clearance}')
+
+    rng = np.random.default_rng(seed)
+
+    grid = np.where(rng.random((width, height), dtype=np.float32) < density, 2, 0).astype(np.int32)
+    grid[::2, ::2] = 1
+    grid[[0, -1], :] = 1
+    grid[:, [0, -1]] = 1
+
+    # spawns sit on odd cells, clear runs along both axes never hit a pillar
+    for i, j in spawn_cells(width, height):
+        di = 1 if i < width // 2 else -1
+        dj = 1 if j < height // 2 else -1
+
+        for k in range(clearance + 1):
+            grid[i + di * k, j] = -1
+            grid[i, j + dj * k] = -1
+
+    return grid
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('fname', help='NPY file to write the map to')
+    parser.add_argument('--size', type=int, nargs=2, default=(21, 21), metavar=('WIDTH', 'HEIGHT'),
+                        help='map size in tiles, odd sizes keep the outer wall on pillar cells')
+    parser.add_argument('--density', type=float, default=.5, help='share of free cells with breakable walls')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the breakable wall layout')
+    parser.add_argument('--clearance', type=int, default=2, help='free cells next to every spawn')
+    args = parser.parse_args()
+
+    np.save(args.fname, generate(*args.size, density=args.density, seed=args.seed, clearance=args.clearance))
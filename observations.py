@@ -0,0 +1,100 @@
+import numpy as np
+
+import assets.objects as objects
+
+from core import load_template
+
+
+def grid_shape(map_fname, cfg):
+    """Tile grid of the world of a map, including the counter rows."""
+    size = load_template(map_fname, cfg).size
+
+    return size[0] // cfg.display.tile_size, size[1] // cfg.display.tile_size
+
+
+class GridObserver:
+    """Writes tile grid channels of a world into preallocated float32 tensors, without rendering."""
+    # occupancy channels read from the spatial indices
+    occupancy = (('solid', objects.SolidWall),
+                 ('breakable', objects.BreakableWall),
+                 ('bomb', objects.Bomb),
+                 ('explosion', objects.Explosion))
+
+    # seconds until detonation, per bomb cell
+    timers = ('fuse',)
+
+    items = ('range', 'lives', 'speed')
+
+    def __init__(self, shape, cfg):
+        """Name one channel per occupancy type, bomb timer, item type and player."""
+        self.cfg = cfg
+        self.channels = (tuple(name for name, cls in self.occupancy) + self.timers +
+                         tuple(f'item_{item_type}' for item_type in self.items) +
+                         tuple(f'player_{i + 1}' for i in range(cfg.core.no_players)))
+        self.index = {name: channel for channel, name in enumerate(self.channels)}
+
+        self.shape = (len(self.channels),) + tuple(shape)
+
+
+    def allocate(self, *batch):
+        """Allocate an observation buffer, with leading batch dimensions if given."""
+        return np.zeros(batch + self.shape, dtype=np.float32)
+
+
+    def observe(self, object_manager, out=None):
+        """Write the channels of a world into out, allocated only if not given."""
+        if out is None:
+            out = self.allocate()
+        else:
+            out.fill(0)
+
+        index = self.index
+        spatial_indices = object_manager.spatial_indices
+
+        for name, cls in self.occupancy:
+            if cls in spatial_indices:
+                np.greater(spatial_indices[cls].counts, 0, out=out[index[name]])
+
+        # earliest detonation per cell, bombs are few
+        store = object_manager.store
+        fuse = out[index['fuse']]
+
+        for slot, bomb in object_manager.type_lists.get(objects.Bomb, dict()).items():
+            if bomb.cell:
+                remaining = store.lifespan_limits[slot] - store.lifespan_counts[slot]
+                fuse[bomb.cell] = min(fuse[bomb.cell], remaining) if fuse[bomb.cell] else remaining
+
+        for item in object_manager.type_lists.get(objects.Item, dict()).values():
+            if item.cell and item.item_type in self.items:
+                out[index[f'item_{item.item_type}']][item.cell] = 1
+
+        for i, player in enumerate(object_manager.players):
+            if player.cell:
+                out[index[f'player_{i + 1}']][player.cell] = 1
+
+        return out
+
+
+    def colors(self):
+        """Get the color of every channel drawn by rasterize, bottom to top."""
+        colors = self.cfg.colors
+
+        return ([(self.index['solid'], colors.solid_wall_color),
+                 (self.index['breakable'], colors.breakable_wall_color)] +
+                [(self.index[f'item_{item_type}'], colors.item_color) for item_type in self.items] +
+                [(self.index['bomb'], colors.bomb_color),
+                 (self.index['explosion'], colors.explosion_color)] +
+                [(self.index[f'player_{i + 1}'], colors.player_colors[i]) for i in range(self.cfg.core.no_players)])
+
+
+    def rasterize(self, observation, out=None):
+        """Draw an observation to an (x, y, rgb) uint8 array, one pixel per tile."""
+        if out is None:
+            out = np.zeros(self.shape[1:] + (3,), dtype=np.uint8)
+
+        out[:] = self.cfg.colors.background_color
+
+        for channel, color in self.colors():
+            out[observation[channel] > 0] = color
+
+        return out
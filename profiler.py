@@ -0,0 +1,66 @@
+import json
+import time
+
+import numpy as np
+
+from collections import deque
+from contextlib import contextmanager
+
+
+class Profiler:
+    """Rolling high resolution timings of core loop phases and object types."""
+    def __init__(self, window=1024):
+        """Keep the last window timings of every phase."""
+        self.window = window
+        self.timings = dict()
+        self.counts = dict()
+
+
+    def add(self, name, duration):
+        """Add a duration in nanoseconds to a phase."""
+        if name not in self.timings:
+            self.timings[name] = deque(maxlen=self.window)
+            self.counts[name] = 0
+
+        self.timings[name].append(duration)
+        self.counts[name] += 1
+
+
+    @contextmanager
+    def phase(self, name):
+        """Time the body of a with statement as a phase."""
+        start = time.perf_counter_ns()
+        yield
+        self.add(name, time.perf_counter_ns() - start)
+
+
+    def summary(self):
+        """Get count, mean and p50, p95 and p99 in microseconds per phase."""
+        summary = dict()
+
+        for name, timings in self.timings.items():
+            timings = np.array(timings) / 1e3
+            p50, p95, p99 = np.percentile(timings, (50, 95, 99))
+
+            summary[name] = {'count': self.counts[name], 'mean': float(timings.mean()),
+                             'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+
+        return summary
+
+
+    def draw(self, screen, font, color, position=(0, 0)):
+        """Draw the rolling p50, p95 and p99 per phase on screen."""
+        x, y = position
+
+        for name, stats in sorted(self.summary().items(), key=lambda item: -item[1]['p95']):
+            text = f"{name:<24}{stats['p50']:>8.0f}{stats['p95']:>8.0f}{stats['p99']:>8.0f} us"
+            surface = font.render(text, True, color)
+            screen.blit(surface, (x, y))
+            y += surface.get_height()
+
+
+    def dump(self, fname):
+        """Write the summary and the raw rolling timings to a JSON file."""
+        with open(fname, 'w') as f:
+            json.dump({'summary': self.summary(),
+                       'timings': {name: list(timings) for name, timings in self.timings.items()}}, f, indent=2)
@@ -0,0 +1,293 @@
+import argparse
+import io
+import os
+import queue
+import struct
+import threading
+import zlib
+
+import numpy as np
+import pygame as pg
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class GifWriter:
+    """Appends palette frames to an animated GIF as they are written, needs Pillow."""
+    def __init__(self, fname):
+        self.file = open(fname, 'wb')
+        self.n_frames = 0
+
+        # delays are in centiseconds, rounding errors are carried to the next frame
+        self.elapsed = 0
+        self.delayed = 0
+
+
+    def write(self, pixels, duration):
+        """Quantize and append a (y, x, rgb) frame, durations are in milliseconds."""
+        height, width, _ = pixels.shape
+
+        # the screen and the loop count come first, every frame carries its own palette
+        if not self.n_frames:
+            self.file.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0, 0, 0) +
+                            b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+
+        palette, flags, data = encode_gif(Image.fromarray(pixels).quantize(colors=64))
+
+        self.elapsed += duration
+        delay = round(self.elapsed / 10) - self.delayed
+        self.delayed += delay
+
+        # graphic control with the delay, then the image with a local palette
+        self.file.write(struct.pack('<BBBBHBB', 0x21, 0xf9, 4, 0x04, delay, 0, 0) +
+                        struct.pack('<BHHHHB', 0x2c, 0, 0, width, height, 0x80 | flags) +
+                        palette + data)
+        self.n_frames += 1
+
+
+    def close(self):
+        self.file.write(b'\x3b')
+        self.file.close()
+
+
+class PngWriter:
+    """Writes numbered PNG frames and their durations into a directory."""
+    def __init__(self, path):
+        self.path = path
+        self.n_frames = 0
+
+        os.makedirs(path, exist_ok=True)
+        self.durations = open(os.path.join(path, 'durations.txt'), 'w')
+
+
+    def write(self, pixels, duration):
+        """Save a (y, x, rgb) frame, durations are in milliseconds."""
+        with open(os.path.join(self.path, f'{self.n_frames:06d}.png'), 'wb') as f:
+            f.write(encode_png(pixels))
+
+        self.durations.write(f'{duration}\n')
+        self.n_frames += 1
+
+
+    def close(self):
+        self.durations.close()
+
+
+def png_chunk(kind, data):
+    """Length, type, data and checksum of a PNG chunk."""
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def encode_png(pixels):
+    """Encode a (y, x, rgb) frame as PNG, zlib runs without holding the GIL."""
+    height, width, _ = pixels.shape
+
+    # every row starts with filter type 0
+    rows = np.zeros((height, 1 + 3 * width), dtype=np.uint8)
+    rows[:, 1:] = pixels.reshape(height, -1)
+
+    return (b'\x89PNG\r\n\x1a\n' +
+            png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            png_chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)) +
+            png_chunk(b'IEND', b''))
+
+
+def skip_blocks(data, i):
+    """Index after the data sub-blocks of a GIF starting at i."""
+    while data[i]:
+        i += data[i] + 1
+
+    return i + 1
+
+
+def encode_gif(image):
+    """Encode a palette image as a single frame GIF, returns its palette, image flags and compressed data.
+
+    The image flags keep the interlacing and palette size bits of the image descriptor.
+    """
+    with io.BytesIO() as f:
+        image.save(f, format='GIF')
+        data = f.getvalue()
+
+    # the global palette follows the logical screen descriptor
+    palette = b''
+    screen_flags = data[10]
+    i = 13
+    if screen_flags & 0x80:
+        palette = data[i:i + 3 * 2 ** ((screen_flags & 7) + 1)]
+        i += len(palette)
+
+    # skip extensions up to the image descriptor
+    while data[i] == 0x21:
+        i = skip_blocks(data, i + 2)
+
+    flags = data[i + 9]
+    i += 10
+
+    # a local palette replaces the global one
+    if flags & 0x80:
+        palette = data[i:i + 3 * 2 ** ((flags & 7) + 1)]
+        i += len(palette)
+    else:
+        flags = (flags & 0x40) | (screen_flags & 7)
+
+    # lzw code size and the compressed sub-blocks
+    end = skip_blocks(data, i + 1)
+
+    return palette, flags & 0x47, data[i:end]
+
+
+def open_writer(fname):
+    """GIF writer for .gif files if Pillow is installed, else PNG frames next to the file name."""
+    root, ext = os.path.splitext(fname)
+
+    if ext.lower() == '.gif' and Image is not None:
+        return GifWriter(fname)
+
+    return PngWriter(root)
+
+
+class FrameRecorder:
+    """Copies the raw pixel rows of drawn frames into pooled buffers that a background thread encodes.
+
+    Live capturing never waits for the encoder: when no buffer is free the frame is dropped
+    and only every second frame is captured from then on, up to cfg.display.capture_max_stride.
+    After a pool's worth of captures in a row the stride is halved again.
+    """
+    def __init__(self, fname, surface, cfg=None, scale=1, wait=False):
+        """Preallocate the buffer pool for frames of a surface, encoded scaled down by an integer.
+
+        Offline recordings set wait to block on a free buffer instead of dropping frames.
+        """
+        self.cfg = cfg
+        self.scale = scale
+        self.wait = wait
+        self.writer = open_writer(fname)
+
+        # capturing is a plain copy of the rows, color channels are picked by the encoder
+        self.bytesize = surface.get_bytesize()
+        if self.bytesize not in (3, 4):
+            raise ValueError(f'can only record 24 or 32 bit surfaces, not {8 * self.bytesize} bit')
+
+        self.width = surface.get_width()
+        self.channels = [shift // 8 for shift in surface.get_shifts()[:3]]
+
+        # raw row buffers, free ones wait in the pool, filled ones in the queue
+        shape = (surface.get_height(), surface.get_pitch())
+        self.pool = queue.SimpleQueue()
+        for i in range(cfg.display.capture_buffers):
+            self.pool.put(np.empty(shape, dtype=np.uint8))
+
+        self.frames = queue.SimpleQueue()
+
+        # capture every stride-th frame, doubled on drops and halved after a streak of captures
+        self.stride = 1
+        self.streak = 0
+        self.n_calls = 0
+        self.n_captured = 0
+        self.n_dropped = 0
+
+        self.thread = threading.Thread(target=self.encode, daemon=True)
+        self.thread.start()
+
+
+    def capture(self, surface, tick):
+        """Copy a surface into a free buffer and queue it, stamped with the tick it shows."""
+        self.n_calls += 1
+        if self.n_calls % self.stride:
+            return
+
+        try:
+            buffer = self.pool.get(block=self.wait)
+        except queue.Empty:
+            self.n_dropped += 1
+            self.stride = min(2 * self.stride, self.cfg.display.capture_max_stride)
+            self.streak = 0
+            return
+
+        # the encoder kept up, capture more often again
+        self.streak += 1
+        if self.stride > 1 and self.streak >= self.cfg.display.capture_buffers:
+            self.stride //= 2
+            self.streak = 0
+
+        # the buffer view locks the surface, it is released right after the copy
+        view = surface.get_buffer()
+        np.copyto(buffer, np.frombuffer(view, dtype=np.uint8).reshape(buffer.shape))
+        view = None
+
+        self.frames.put((buffer, tick))
+        self.n_captured += 1
+
+
+    def encode(self):
+        """Encode queued frames until the end marker, frames last until the next one."""
+        tick_ms = 1000 / self.cfg.core.tick_rate
+        pending = None
+
+        while True:
+            frame = self.frames.get()
+
+            if pending:
+                buffer, tick = pending
+                end = frame[1] if frame else tick + 1
+
+                rows = buffer[::self.scale, :self.bytesize * self.width].reshape(-1, self.width, self.bytesize)
+                self.writer.write(rows[:, ::self.scale, self.channels], round((end - tick) * tick_ms))
+                self.pool.put(buffer)
+
+            if frame is None:
+                break
+
+            pending = frame
+
+        self.writer.close()
+
+
+    def close(self):
+        """Encode the remaining frames and finish the file."""
+        self.frames.put(None)
+        self.thread.join()
+
+
+def record_replay(replay_fname, fname, cfg=None, scale=1, every=1):
+    """Draw a replay offscreen and record every n-th tick, returns the recorder."""
+    from replay import check_players, load_replay
+    from session import GameSession
+
+    map_fname, seed, spawn_positions, n_ticks, actions = load_replay(replay_fname)
+    check_players(replay_fname, actions, cfg)
+
+    session = GameSession(map_fname, cfg=cfg, counters=True, spawn_positions=spawn_positions)
+    session.reset(seed=seed)
+
+    screen = pg.Surface((cfg.display.screen_width, cfg.display.screen_height))
+    recorder = FrameRecorder(fname, screen, cfg=cfg, scale=scale, wait=True)
+
+    for tick in range(n_ticks):
+        session.step(actions[tick])
+
+        if tick % every == 0:
+            session.draw(screen)
+            recorder.capture(screen, session.tick)
+
+    recorder.close()
+
+    return recorder
+
+
+if __name__ == '__main__':
+    from config import config as cfg
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('replay', help='replay file to record, see replay.py')
+    parser.add_argument('out', help='GIF file, or directory of PNG frames without Pillow')
+    parser.add_argument('--scale', type=int, default=1, help='keep every n-th pixel')
+    parser.add_argument('--every', type=int, default=4, help='draw every n-th tick')
+    args = parser.parse_args()
+
+    recorder = record_replay(args.replay, args.out, cfg=cfg, scale=args.scale, every=args.every)
+    print(f'{args.out}: {recorder.n_captured} frames, {recorder.n_dropped} dropped')
@@ -0,0 +1,132 @@
+import struct
+import sys
+import time
+
+import numpy as np
+
+from session import GameSession
+
+
+# header: magic, version, match seed, number of players, map file name length
+HEADER = struct.Struct('<4sBQBH')
+MAGIC = b'BMRP'
+VERSION = 2
+
+# after the map file name: spawn position per player
+SPAWN = struct.Struct('<ii')
+
+# input change: tick, player, dx, dy, drop bomb; player END marks the last tick
+ENTRY = struct.Struct('<IBbbB')
+END = 255
+
+
+class InputRecorder:
+    """Records per-tick player inputs of a session to a compact binary log."""
+    def __init__(self, fname, session):
+        """Open the log and write the header for the current match."""
+        self.file = open(fname, 'wb')
+        self.session = session
+
+        map_fname = session.map_fname.encode()
+        n_players = session.cfg.core.no_players
+
+        self.file.write(HEADER.pack(MAGIC, VERSION, session.match_seed, n_players, len(map_fname)))
+        self.file.write(map_fname)
+
+        for position in session.spawn_positions[:n_players]:
+            self.file.write(SPAWN.pack(*position))
+
+        # last recorded row per player, only changes are written
+        self.last_actions = np.zeros((n_players, 3), dtype=np.int8)
+
+        session.recorder = self
+
+
+    def record(self, tick, actions):
+        """Write the rows that differ from the previous tick."""
+        for player in np.flatnonzero(np.any(actions != self.last_actions, axis=1)):
+            self.file.write(ENTRY.pack(tick, player, *actions[player].tolist()))
+
+        self.last_actions[:] = actions
+
+        # bomb drops only last a single tick
+        self.last_actions[:, 2] = 0
+
+
+    def close(self):
+        """Write the end marker with the number of ticks and close the log."""
+        self.file.write(ENTRY.pack(self.session.tick, END, 0, 0, 0))
+        self.file.close()
+
+        self.session.recorder = None
+
+
+def load_replay(fname):
+    """Read a log, returns the map file name, match seed, spawn positions, number of ticks and input array."""
+    with open(fname, 'rb') as f:
+        magic, version, seed, n_players, length = HEADER.unpack(f.read(HEADER.size))
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{fname} is not a version {VERSION} replay')
+
+        map_fname = f.read(length).decode()
+        spawn_positions = [SPAWN.unpack(f.read(SPAWN.size)) for i in range(n_players)]
+        data = f.read()
+
+    # logs of games that did not end cleanly are cut off or miss the end marker
+    if len(data) % ENTRY.size:
+        raise ValueError(f'{fname} is cut off in the middle of an input change')
+
+    entries = np.frombuffer(data, dtype=np.dtype([('tick', '<u4'), ('player', 'u1'),
+                                                  ('dx', 'i1'), ('dy', 'i1'), ('drop', 'u1')]))
+
+    if not len(entries) or entries['player'][-1] != END:
+        raise ValueError(f'{fname} has no end marker, the recording did not finish')
+
+    n_ticks = int(entries['tick'][-1])
+    entries = entries[:-1]
+
+    # expand the changes to one row per tick and player
+    actions = np.zeros((n_ticks, n_players, 3), dtype=np.int8)
+    current = np.zeros((n_players, 3), dtype=np.int8)
+
+    changes = np.searchsorted(entries['tick'], np.arange(n_ticks + 1))
+
+    for tick in range(n_ticks):
+        for entry in entries[changes[tick]:changes[tick + 1]]:
+            current[entry['player']] = (entry['dx'], entry['dy'], entry['drop'])
+
+        actions[tick] = current
+        current[:, 2] = 0
+
+    return map_fname, seed, spawn_positions, n_ticks, actions
+
+
+def check_players(fname, actions, cfg):
+    """Input rows belong to the players of the recording, raises if the config has a different number."""
+    if actions.shape[1] != cfg.core.no_players:
+        raise ValueError(f'{fname} has {actions.shape[1]} players, the config has {cfg.core.no_players}')
+
+
+def play(fname, cfg=None):
+    """Replay a log headless at maximum speed, returns the finished session."""
+    map_fname, seed, spawn_positions, n_ticks, actions = load_replay(fname)
+    check_players(fname, actions, cfg)
+
+    session = GameSession(map_fname, cfg=cfg, spawn_positions=spawn_positions)
+    session.reset(seed=seed)
+    session.run(n_ticks, actions)
+
+    return session
+
+
+if __name__ == '__main__':
+    from config import config as cfg
+
+    for fname in sys.argv[1:]:
+        start = time.perf_counter()
+        session = play(fname, cfg=cfg)
+        duration = time.perf_counter() - start
+
+        scores = [player.n_score for player in session.object_manager.players]
+        print(f'{fname}: {session.tick} ticks, scores {scores}, {session.tick / duration:.0f} ticks/s')
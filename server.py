@@ -0,0 +1,430 @@
+import argparse
+import asyncio
+import os
+import struct
+import time
+
+import numpy as np
+
+from session import GameSession
+
+
+# message types
+JOIN, INPUT, WELCOME, DELTA, END = range(5)
+
+# client messages: join a match, input of a player for a tick
+JOIN_MESSAGE = struct.Struct('<BI')
+INPUT_MESSAGE = struct.Struct('<BIbbB')
+
+# server messages: seat and match seed, world changes up to a tick, end of a match with the number of players
+WELCOME_MESSAGE = struct.Struct('<BIBQ')
+DELTA_MESSAGE = struct.Struct('<BIIII')
+END_MESSAGE = struct.Struct('<BIB')
+
+# delta entries, killed slots come first, then spawned and moved objects
+KILLED = np.dtype('<u4')
+SPAWNED = np.dtype([('slot', '<u4'), ('type', 'u1'), ('x', '<i2'), ('y', '<i2')])
+MOVED = np.dtype([('slot', '<u4'), ('x', '<i2'), ('y', '<i2')])
+SCORES = np.dtype('<i4')
+
+# bytes queued for a client that does not keep up before it is dropped
+MAX_BUFFER = 1 << 24
+
+
+def encode_delta(tick, killed, spawned, moved):
+    """Pack killed slots and spawned and moved entries into a delta message."""
+    return b''.join((DELTA_MESSAGE.pack(DELTA, tick, len(killed), len(spawned), len(moved)),
+                     np.asarray(killed, dtype=KILLED).tobytes(),
+                     np.array(spawned, dtype=SPAWNED).tobytes(),
+                     np.asarray(moved, dtype=MOVED).tobytes()))
+
+
+async def read_message(reader):
+    """Read one server message, returns its type and fields."""
+    message_type = (await reader.readexactly(1))[0]
+
+    if message_type == WELCOME:
+        return WELCOME_MESSAGE.unpack(bytes([message_type]) + await reader.readexactly(WELCOME_MESSAGE.size - 1))
+
+    if message_type == DELTA:
+        _, tick, n_killed, n_spawned, n_moved = DELTA_MESSAGE.unpack(
+            bytes([message_type]) + await reader.readexactly(DELTA_MESSAGE.size - 1))
+
+        killed = np.frombuffer(await reader.readexactly(n_killed * KILLED.itemsize), dtype=KILLED)
+        spawned = np.frombuffer(await reader.readexactly(n_spawned * SPAWNED.itemsize), dtype=SPAWNED)
+        moved = np.frombuffer(await reader.readexactly(n_moved * MOVED.itemsize), dtype=MOVED)
+
+        return message_type, tick, killed, spawned, moved
+
+    if message_type == END:
+        _, tick, n_players = END_MESSAGE.unpack(bytes([message_type]) + await reader.readexactly(END_MESSAGE.size - 1))
+        scores = np.frombuffer(await reader.readexactly(n_players * SCORES.itemsize), dtype=SCORES)
+
+        return message_type, tick, scores
+
+    raise ValueError(f'unknown message type {message_type}')
+
+
+class DeltaTracker:
+    """Collects objects spawned, killed and moved in a world since the last delta."""
+    def __init__(self, object_manager):
+        """Start tracking from the current world."""
+        self.object_manager = object_manager
+
+        self.spawned = dict()
+        self.killed = list()
+
+        # positions at the last delta
+        self.positions = object_manager.store.positions.copy()
+
+        object_manager.observers.append(self)
+
+
+    def on_link(self, obj):
+        """Remember a spawned object."""
+        self.spawned[obj.slot] = obj
+
+
+    def on_unlink(self, obj):
+        """Remember a killed object, unless it never made it into a delta."""
+        if self.spawned.get(obj.slot) is obj:
+            del self.spawned[obj.slot]
+        else:
+            self.killed.append(obj.slot)
+
+
+    def state(self, tick):
+        """Encode the whole world as spawned objects."""
+        return encode_delta(tick, [], [(slot, obj.type_id, *obj.position)
+                                       for slot, obj in self.object_manager.render_list.items()], [])
+
+
+    def delta(self, tick):
+        """Encode and reset the changes since the last delta."""
+        store = self.object_manager.store
+
+        # grown or shrunk stores, new slots are free so they never count as moved
+        if len(self.positions) != store.capacity:
+            positions = np.zeros_like(store.positions)
+            n = min(len(positions), len(self.positions))
+            positions[:n] = self.positions[:n]
+            self.positions = positions
+
+        # spawned objects are sent with their current position
+        moved = np.any(store.positions != self.positions, axis=1) & store.alive
+        moved[list(self.spawned)] = False
+
+        slots = np.flatnonzero(moved)
+        entries = np.empty(len(slots), dtype=MOVED)
+        entries['slot'] = slots
+        entries['x'] = store.positions[slots, 0]
+        entries['y'] = store.positions[slots, 1]
+
+        message = encode_delta(tick, self.killed, [(slot, obj.type_id, *obj.position)
+                                                   for slot, obj in self.spawned.items()], entries)
+
+        self.spawned.clear()
+        self.killed.clear()
+        np.copyto(self.positions, store.positions)
+
+        return message
+
+
+class Match:
+    """Authoritative lockstep simulation of one match and its remote players."""
+    def __init__(self, match_id, map_fname, cfg=None, seed=None, tick_timeout=None):
+        """Create the world, the match starts once every seat is taken."""
+        self.match_id = match_id
+        self.tick_timeout = tick_timeout
+
+        self.session = GameSession(map_fname, cfg=cfg, seed=seed)
+        self.tracker = DeltaTracker(self.session.object_manager)
+
+        # one seat per human player, inputs of the next tick per seat
+        self.writers = [None] * len(self.session.humans)
+        self.actions = np.zeros((len(self.writers), 3), dtype=np.int8)
+        self.received = set()
+        self.ready = asyncio.Event()
+
+        self.task = None
+        self.finished = False
+
+
+    @property
+    def connected(self):
+        """Get the seats with a connected client."""
+        return {seat for seat, writer in enumerate(self.writers) if writer}
+
+
+    def join(self, writer):
+        """Seat a client, returns the seat or None if the match is full or running."""
+        if self.task or None not in self.writers:
+            return None
+
+        seat = self.writers.index(None)
+        self.writers[seat] = writer
+
+        writer.write(WELCOME_MESSAGE.pack(WELCOME, self.match_id, seat, self.session.match_seed))
+        writer.write(self.tracker.state(self.session.tick))
+
+        if None not in self.writers:
+            self.task = asyncio.create_task(self.run())
+
+        return seat
+
+
+    def leave(self, seat):
+        """Free the seat of a disconnected client, its player stops."""
+        self.writers[seat] = None
+        self.actions[seat] = 0
+
+        # a match left by all its clients before it started is over
+        if not self.task and not self.connected:
+            self.finished = True
+
+        if self.received >= self.connected:
+            self.ready.set()
+
+
+    def input(self, seat, tick, dx, dy, drop):
+        """Store the input of a seat, late inputs apply to the next tick."""
+        # remote inputs are reduced to a single step along one axis and a drop flag
+        dx, dy = np.sign(dx), np.sign(dy)
+        if dx:
+            dy = 0
+
+        self.actions[seat, :2] = (dx, dy)
+        self.actions[seat, 2] |= bool(drop)
+
+        if tick == self.session.tick:
+            self.received.add(seat)
+
+            if self.received >= self.connected:
+                self.ready.set()
+
+
+    async def broadcast(self, message):
+        """Send a message to all connected clients, dropping clients too far behind."""
+        for seat, writer in enumerate(self.writers):
+            if writer:
+                writer.write(message)
+
+                if writer.transport.get_write_buffer_size() > MAX_BUFFER:
+                    writer.close()
+                    self.leave(seat)
+
+        # wait until the clients took the message, disconnects are handled by the readers
+        await asyncio.gather(*(writer.drain() for writer in self.writers if writer), return_exceptions=True)
+
+
+    async def run(self):
+        """Step the world whenever all inputs of a tick are in, or the tick timed out."""
+        session = self.session
+
+        while not session.done and self.connected:
+            if not self.received >= self.connected:
+                try:
+                    await asyncio.wait_for(self.ready.wait(), self.tick_timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+            self.ready.clear()
+            self.received.clear()
+
+            session.step(self.actions)
+
+            # bomb drops only last a single tick
+            self.actions[:, 2] = 0
+
+            await self.broadcast(self.tracker.delta(session.tick))
+
+        scores = np.array([player.n_score for player in session.object_manager.players], dtype=SCORES)
+        await self.broadcast(END_MESSAGE.pack(END, session.tick, len(scores)) + scores.tobytes())
+
+        for writer in self.writers:
+            if writer:
+                writer.close()
+
+        self.finished = True
+
+
+class Server:
+    """Hosts many concurrent lockstep matches in one process."""
+    def __init__(self, map_fname, cfg=None, seed=None, tick_timeout=None, max_pending=None):
+        self.map_fname = map_fname
+        self.cfg = cfg
+        self.tick_timeout = tick_timeout
+        self.max_pending = max_pending or cfg.core.max_pending_matches
+
+        # every match draws its own seed from the server seed
+        self.seed_sequence = np.random.SeedSequence(seed)
+
+        self.matches = dict()
+
+
+    def get_match(self, match_id):
+        """Get a running match or create one, None if too many matches wait for players.
+
+        Finished matches are dropped.
+        """
+        for key in [key for key, match in self.matches.items() if match.finished]:
+            del self.matches[key]
+
+        if match_id not in self.matches:
+            if sum(not match.task for match in self.matches.values()) >= self.max_pending:
+                return None
+
+            seed = int(self.seed_sequence.spawn(1)[0].generate_state(1, dtype=np.uint64)[0])
+            self.matches[match_id] = Match(match_id, self.map_fname, cfg=self.cfg, seed=seed,
+                                           tick_timeout=self.tick_timeout)
+
+        return self.matches[match_id]
+
+
+    async def handle(self, reader, writer):
+        """Seat a connecting client and feed its inputs to the match."""
+        try:
+            _, match_id = JOIN_MESSAGE.unpack(await reader.readexactly(JOIN_MESSAGE.size))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+
+        match = self.get_match(match_id)
+        seat = match.join(writer) if match else None
+
+        if seat is None:
+            writer.close()
+            return
+
+        try:
+            while True:
+                _, tick, dx, dy, drop = INPUT_MESSAGE.unpack(await reader.readexactly(INPUT_MESSAGE.size))
+                match.input(seat, tick, dx, dy, drop)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            match.leave(seat)
+
+            # matches that never started hold a world, they are dropped right away
+            if match.finished and self.matches.get(match_id) is match:
+                del self.matches[match_id]
+
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Start listening, returns the asyncio server."""
+        return await asyncio.start_server(self.handle, host, port)
+
+
+class Client:
+    """Remote player mirroring the world from the server deltas."""
+    def __init__(self):
+        # type and position per slot
+        self.objects = dict()
+
+        self.seat = None
+        self.seed = None
+        self.tick = 0
+        self.scores = None
+
+
+    def apply(self, killed, spawned, moved):
+        """Apply the entries of a delta to the mirrored world."""
+        for slot in killed.tolist():
+            del self.objects[slot]
+
+        for slot, type_id, x, y in spawned.tolist():
+            self.objects[slot] = [type_id, x, y]
+
+        for slot, x, y in moved.tolist():
+            self.objects[slot][1:] = x, y
+
+
+    async def play(self, policy, match_id=0, host='127.0.0.1', port=0):
+        """Join a match and send policy(client) inputs every tick, returns the final scores."""
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(JOIN_MESSAGE.pack(JOIN, match_id))
+
+        try:
+            while True:
+                message = await read_message(reader)
+
+                if message[0] == WELCOME:
+                    _, _, self.seat, self.seed = message
+                elif message[0] == DELTA:
+                    _, self.tick, killed, spawned, moved = message
+                    self.apply(killed, spawned, moved)
+
+                    dx, dy, drop = policy(self)
+                    writer.write(INPUT_MESSAGE.pack(INPUT, self.tick, dx, dy, drop))
+                else:
+                    _, self.tick, self.scores = message
+                    break
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+        return self.scores
+
+
+def random_policy(seed):
+    """Policy keeping a random direction and dropping bombs now and then."""
+    rng = np.random.default_rng(seed)
+    action = [0, 0, 0]
+
+    def policy(client):
+        if rng.random() < .05:
+            action[:2] = ((0, -1), (0, 1), (-1, 0), (1, 0))[rng.integers(4)]
+        action[2] = int(rng.random() < .01)
+        return action
+
+    return policy
+
+
+async def loopback(map_fname, cfg, n_matches, seed=None):
+    """Play matches with random local clients, returns the ticks per second of all matches."""
+    server = Server(map_fname, cfg=cfg, seed=seed, max_pending=n_matches)
+    listener = await server.start()
+    port = listener.sockets[0].getsockname()[1]
+
+    n_seats = cfg.core.no_players - cfg.core.no_bots
+
+    start = time.perf_counter()
+    clients = [Client().play(random_policy(i * n_seats + j), match_id=i, port=port)
+               for i in range(n_matches) for j in range(n_seats)]
+    await asyncio.gather(*clients)
+    duration = time.perf_counter() - start
+
+    listener.close()
+    await listener.wait_closed()
+
+    return n_matches * cfg.core.max_ticks / duration
+
+
+if __name__ == '__main__':
+    from config import config as cfg
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=7777, help='port to listen on')
+    parser.add_argument('--map', default=os.path.join('assets', 'maps', 'test.npy'), help='map of all matches')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the match seeds')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds to wait for inputs before a tick')
+    parser.add_argument('--ticks', type=int, default=None, help='ticks per match')
+    parser.add_argument('--loopback', type=int, default=0, help='play this many matches with local random clients')
+    args = parser.parse_args()
+
+    if args.ticks:
+        cfg.core.max_ticks = args.ticks
+
+    if args.loopback:
+        tps = asyncio.run(loopback(args.map, cfg, args.loopback, seed=args.seed))
+        print(f'{args.loopback} matches, {tps:.0f} ticks/s')
+    else:
+        async def serve():
+            server = await Server(args.map, cfg=cfg, seed=args.seed, tick_timeout=args.timeout).start(args.host,
+                                                                                                     args.port)
+            async with server:
+                await server.serve_forever()
+
+        asyncio.run(serve())
@@ -0,0 +1,208 @@
+import numpy as np
+
+from bots import Bot, FieldCache
+from core import (ActionManager, Camera, ObjectManager, add_counters, add_players, load_template,
+                  paused_gc)
+from observations import GridObserver, grid_shape
+
+
+class GameSession:
+    """Headless game session, stepped one fixed tick at a time."""
+    # per player observation: position, vector, lives, score, bombs, bomb radius
+    n_features = 8
+
+    def __init__(self, map_fname, cfg=None, counters=False, seed=None, profiler=None, bot_classes=None,
+                 spawn_positions=None):
+        """Initialize the world from a map without touching the display, bots are of bot_classes if given."""
+        self.cfg = cfg
+        self.map_fname = map_fname
+        self.counters = counters
+
+        # players start at map specific positions if given, replays record them
+        self.spawn_positions = [tuple(position) for position in spawn_positions or cfg.core.player_spawn_positions]
+
+        # one class per bot player, see tournament.py
+        self.bot_classes = bot_classes or [Bot] * cfg.core.no_bots
+
+        # every match draws its own seed from the session seed
+        self.seed_sequence = np.random.SeedSequence(seed)
+
+        # optional input recorder and profiler, see replay.py and profiler.py
+        self.recorder = None
+        self.profiler = profiler
+
+        # tile grid observations, the grid is fixed by the map
+        self.grid_observer = GridObserver(grid_shape(map_fname, cfg), cfg)
+
+        self.reset()
+
+
+    def reset(self, seed=None):
+        """Start a new match on the same map, seeded from the session if no seed is given."""
+        cfg = self.cfg
+
+        if seed is None:
+            seed = int(self.seed_sequence.spawn(1)[0].generate_state(1, dtype=np.uint64)[0])
+
+        self.match_seed = seed
+
+        # init objects, the world is sized by the map and walls do not count against the object limit
+        template = load_template(self.map_fname, cfg=cfg)
+
+        self.object_manager = ObjectManager(cfg=cfg, seed=seed, size=template.size,
+                                            capacity=cfg.core.object_limit + len(template.prototypes),
+                                            soft_limit=cfg.core.soft_object_limit + len(template.prototypes))
+        with paused_gc():
+            template.instantiate(self.object_manager, static_layer=self.counters)
+
+        add_players(self.object_manager, cfg, self.spawn_positions)
+
+        # counters are only needed when the session is drawn
+        if self.counters:
+            add_counters(self.object_manager, cfg)
+
+        self.action_manager = ActionManager(self.object_manager, cfg=cfg)
+
+        # worlds larger than the screen are drawn around the first player
+        screen = (cfg.display.screen_width, cfg.display.screen_height)
+        if template.size[0] > screen[0] or template.size[1] > screen[1]:
+            self.camera = Camera(self.object_manager, screen)
+        else:
+            self.camera = None
+        self.object_manager.profiler = self.profiler
+
+        # the last players are bots, sharing one field cache
+        n_humans = cfg.core.no_players - cfg.core.no_bots
+        players = list(self.object_manager.players)
+
+        self.fields = FieldCache(self.object_manager) if cfg.core.no_bots else None
+        self.bots = [cls(player, self.fields, self.action_manager)
+                     for cls, player in zip(self.bot_classes, players[n_humans:])]
+        self.humans = players[:n_humans]
+
+        # phases of a tick, in order
+        self.phases = (('bots', self.step_bots),
+                       ('movement', self.action_manager.handle_player_movement),
+                       ('actions', self.action_manager.handle_player_actions),
+                       ('collisions', self.action_manager.handle_collisions),
+                       ('update', self.object_manager.update))
+
+        self.tick = 0
+        self.accumulator = 0.
+        self.scores = np.zeros(cfg.core.no_players)
+
+
+    @property
+    def done(self):
+        """Match is over when time runs out or a player has no lives left."""
+        if self.tick >= self.cfg.core.max_ticks:
+            return True
+
+        return any(player.n_lives <= 0 for player in self.object_manager.players)
+
+
+    def observe(self, out=None):
+        """Write per-player features into an (no_players, n_features) array."""
+        if out is None:
+            out = np.zeros((self.cfg.core.no_players, self.n_features), dtype=np.float32)
+
+        for i, player in enumerate(self.object_manager.players):
+            out[i] = (*player.position, *player.vector,
+                      player.n_lives, player.n_score, player.n_bombs, player.n_bomb_radius)
+
+        return out
+
+
+    def observe_grid(self, out=None):
+        """Write the tile grid channels of the world into a (n_channels, width, height) array."""
+        return self.grid_observer.observe(self.object_manager, out=out)
+
+
+    def rewards(self):
+        """Get per-player score gained since the last call."""
+        scores = np.array([player.n_score for player in self.object_manager.players], dtype=float)
+        rewards = scores - self.scores
+        self.scores = scores
+
+        return rewards
+
+
+    def apply_actions(self, actions):
+        """Write per-player (dx, dy, drop bomb) rows into the player buffers."""
+        actions = np.asarray(actions, dtype=np.int8).reshape(-1, 3)
+
+        if self.recorder:
+            self.recorder.record(self.tick, actions)
+
+        # rows of bot players are ignored
+        for player, (dx, dy, drop) in zip(self.humans, actions):
+            player.movement_buffer.x = dx
+            player.movement_buffer.y = dy
+
+            if drop:
+                self.action_manager.request_bomb(player)
+
+
+    def step_bots(self):
+        """Let bots fill their movement and action buffers."""
+        for bot in self.bots:
+            bot.act()
+
+
+    def step(self, actions=None):
+        """Advance the world by one tick; None keeps the current buffers."""
+        if actions is not None:
+            self.apply_actions(actions)
+
+        # positions before the tick, rendering interpolates from them
+        store = self.object_manager.store
+        np.copyto(store.previous, store.positions)
+
+        # handle movement, actions and collisions, then update lifespans
+        if self.profiler:
+            for name, phase in self.phases:
+                with self.profiler.phase(name):
+                    phase()
+        else:
+            for name, phase in self.phases:
+                phase()
+
+        self.tick += 1
+
+
+    def advance(self, seconds, actions=None):
+        """Step as many fixed ticks as fit in the elapsed seconds, returns the fraction of a tick left."""
+        tick_seconds = 1 / self.cfg.core.tick_rate
+        self.accumulator += seconds
+
+        # actions apply to the first tick, later ticks keep the buffers
+        n_ticks = 0
+        while self.accumulator >= tick_seconds:
+            if n_ticks == self.cfg.core.max_catch_up_ticks:
+                # too far behind, slow down instead of spiraling
+                self.accumulator = 0.
+                break
+
+            self.step(actions if n_ticks == 0 else None)
+            self.accumulator -= tick_seconds
+            n_ticks += 1
+
+        return self.accumulator / tick_seconds
+
+
+    def run(self, n_ticks, actions=None):
+        """Advance the world by n ticks with fixed or per-tick actions."""
+        for i in range(n_ticks):
+            if actions is not None and np.ndim(actions) == 3:
+                self.step(actions[i])
+            else:
+                self.step(actions)
+
+
+    def draw(self, screen, alpha=1.):
+        """Draw the world to a surface, alpha of the way from the previous to the current tick."""
+        if self.camera:
+            self.camera.follow(self.object_manager.players[1].sprite.center)
+            self.camera.draw(screen, alpha)
+        else:
+            self.object_manager.draw_all(screen, alpha)
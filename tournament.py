@@ -0,0 +1,181 @@
+import argparse
+import importlib
+import itertools
+import json
+import os
+import time
+
+import multiprocessing as mp
+import numpy as np
+
+import mapgen
+
+from config import Config
+from profiler import Profiler
+from session import GameSession
+
+
+def load_variant(name):
+    """Import a bot class from a module:class name."""
+    module, cls = name.split(':')
+
+    return getattr(importlib.import_module(module), cls)
+
+
+def match_id(spec):
+    """Key of a match in the checkpoint, unique per map, seed and seating."""
+    return f"{spec['map']}|{spec['seed']}|{','.join(spec['variants'])}"
+
+
+def schedule(maps, seeds, variants, n_players=2):
+    """Every map and seed with every seating of the variants, including mirror matches."""
+    return [{'map': map_fname, 'seed': seed, 'variants': list(seating)}
+            for map_fname in maps
+            for seed in seeds
+            for seating in itertools.product(variants, repeat=n_players)]
+
+
+def init_worker(base_cfg):
+    """Keep the config of the run in every worker."""
+    global cfg
+    cfg = base_cfg
+
+
+def play_match(spec):
+    """Play one bots only match headless to the end, returns its result row."""
+    n_players = len(spec['variants'])
+
+    # players start in the corners of the map
+    grid_shape = np.load(spec['map'], mmap_mode='r').shape
+    cfg.core.no_players = n_players
+    cfg.core.no_bots = n_players
+
+    profiler = Profiler(window=cfg.core.max_ticks)
+    session = GameSession(spec['map'], cfg=cfg, seed=spec['seed'], profiler=profiler,
+                          spawn_positions=mapgen.spawn_positions(grid_shape, cfg.display.tile_size),
+                          bot_classes=[load_variant(name) for name in spec['variants']])
+
+    start = time.perf_counter()
+    while not session.done:
+        session.step()
+    duration = time.perf_counter() - start
+
+    players = list(session.object_manager.players)
+    scores = [player.n_score for player in players]
+
+    # seat of the last player standing, else of the best score, ties are draws
+    alive = [i for i, player in enumerate(players) if player.n_lives > 0]
+    ranked = alive if len(alive) == 1 else [i for i, score in enumerate(scores) if score == max(scores)]
+    winner = ranked[0] if len(ranked) == 1 else None
+
+    return dict(spec, id=match_id(spec), winner=winner, n_score=scores, ticks=session.tick, seconds=duration,
+                phases={name: stats['mean'] for name, stats in profiler.summary().items()})
+
+
+def load_checkpoint(fname):
+    """Read the results written so far, returns them and the byte offset after the last complete line."""
+    results = []
+    offset = 0
+
+    if os.path.exists(fname):
+        with open(fname, 'rb') as f:
+            for line in f:
+                # a line cut off by an interrupt ends the checkpoint
+                if not line.endswith(b'\n'):
+                    break
+
+                try:
+                    results.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+
+                offset += len(line)
+
+    return results, offset
+
+
+def run(specs, fname, cfg=None, n_workers=None):
+    """Play the matches not in the checkpoint on a worker pool, appending results as they finish."""
+    results, offset = load_checkpoint(fname)
+    done = {result['id'] for result in results}
+    pending = [spec for spec in specs if match_id(spec) not in done]
+
+    # drop a cut off last line in place, complete lines are never rewritten
+    if os.path.exists(fname) and os.path.getsize(fname) > offset:
+        os.truncate(fname, offset)
+
+    if not pending:
+        return results
+
+    # idle workers pull the next match, long matches do not hold up a fixed share of the queue
+    with mp.Pool(n_workers or os.cpu_count(), initializer=init_worker, initargs=(cfg,)) as pool, \
+         open(fname, 'a') as f:
+        for i, result in enumerate(pool.imap_unordered(play_match, pending, chunksize=1)):
+            f.write(json.dumps(result) + '\n')
+            f.flush()
+            results.append(result)
+
+            winner = 'draw' if result['winner'] is None else result['variants'][result['winner']]
+            print(f"{len(done) + i + 1}/{len(specs)} {result['id']}: {winner}, {result['ticks']} ticks", flush=True)
+
+    return results
+
+
+def aggregate(results):
+    """Per variant matches, wins, draws, mean score and ticks, and mean microseconds per phase over all matches."""
+    table = dict()
+    phases = dict()
+
+    for result in results:
+        for seat, (variant, score) in enumerate(zip(result['variants'], result['n_score'])):
+            row = table.setdefault(variant, {'matches': 0, 'wins': 0, 'draws': 0, 'scores': [], 'ticks': []})
+            row['matches'] += 1
+            row['wins'] += result['winner'] == seat
+            row['draws'] += result['winner'] is None
+            row['scores'].append(score)
+            row['ticks'].append(result['ticks'])
+
+        for name, mean in result['phases'].items():
+            phases.setdefault(name, []).append(mean)
+
+    variants = {variant: {'matches': row['matches'], 'wins': row['wins'], 'draws': row['draws'],
+                          'win_rate': row['wins'] / row['matches'], 'n_score': float(np.mean(row['scores'])),
+                          'ticks': float(np.mean(row['ticks']))}
+                for variant, row in table.items()}
+
+    return {'variants': variants, 'phases': {name: float(np.mean(means)) for name, means in phases.items()}}
+
+
+def format_table(aggregated):
+    """Aggregate table as text, best win rate first, then the phase timings."""
+    lines = [f"{'variant':<24}{'matches':>8}{'wins':>8}{'draws':>8}{'win rate':>10}{'score':>10}{'ticks':>10}"]
+
+    for variant, row in sorted(aggregated['variants'].items(), key=lambda item: -item[1]['win_rate']):
+        lines.append(f"{variant:<24}{row['matches']:>8}{row['wins']:>8}{row['draws']:>8}{row['win_rate']:>10.2f}"
+                     f"{row['n_score']:>10.1f}{row['ticks']:>10.0f}")
+
+    lines.append('')
+    lines += [f'{name:<24}{mean:>10.1f} us per call' for name, mean in aggregated['phases'].items()]
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--maps', nargs='+', default=[os.path.join('assets', 'maps', 'test.npy')], help='maps to play on')
+    parser.add_argument('--seeds', type=int, default=8, help='seeds per map and seating')
+    parser.add_argument('--variants', nargs='+', default=['bots:Bot'], help='bot classes as module:class')
+    parser.add_argument('--players', type=int, default=2, help='players per match')
+    parser.add_argument('--ticks', type=int, default=None, help='ticks before a match is a draw on score')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, one per core by default')
+    parser.add_argument('--out', default='tournament.jsonl', help='JSONL checkpoint and results, resumed if present')
+    args = parser.parse_args()
+
+    base_cfg = Config()
+    if args.ticks:
+        base_cfg.core.max_ticks = args.ticks
+
+    specs = schedule(args.maps, range(args.seeds), args.variants, n_players=args.players)
+    results = run(specs, args.out, cfg=base_cfg, n_workers=args.workers)
+
+    print(format_table(aggregate(results)))
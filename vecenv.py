@@ -0,0 +1,196 @@
+import os
+import traceback
+
+import multiprocessing as mp
+import numpy as np
+
+from multiprocessing.shared_memory import SharedMemory
+from observations import GridObserver, grid_shape
+from session import GameSession
+
+
+def buffer_specs(n_envs, cfg, grid=None):
+    """Shapes and types of the shared action, observation, reward and done buffers, and tile grids if shaped."""
+    n_players = cfg.core.no_players
+
+    specs = {'actions': ((n_envs, n_players, 3), np.int8),
+             'observations': ((n_envs, n_players, GameSession.n_features), np.float32),
+             'rewards': ((n_envs, n_players), np.float32),
+             'dones': ((n_envs,), np.bool_)}
+
+    if grid:
+        specs['grids'] = ((n_envs,) + GridObserver(grid, cfg).shape, np.float32)
+
+    return specs
+
+
+def attach_buffers(names, specs):
+    """Map shared memory blocks to numpy arrays."""
+    blocks = {key: SharedMemory(name=names[key]) for key in specs}
+    arrays = {key: np.ndarray(shape, dtype=dtype, buffer=blocks[key].buf)
+              for key, (shape, dtype) in specs.items()}
+
+    return blocks, arrays
+
+
+def worker(pipe, names, specs, envs, seeds, map_fname, cfg):
+    """Step a slice of the sessions on command, writing results to shared memory.
+
+    Errors are sent back in place of the command and raised by the parent, the worker keeps running.
+    """
+    blocks, arrays = attach_buffers(names, specs)
+
+    try:
+        sessions = {i: GameSession(map_fname, cfg=cfg, seed=seed) for i, seed in zip(envs, seeds)}
+        failure = None
+    except Exception:
+        sessions = dict()
+        failure = traceback.format_exc()
+
+    while True:
+        command = pipe.recv()
+
+        try:
+            # sessions that failed to start fail every command but close
+            if failure and command != 'close':
+                raise RuntimeError(f'sessions failed to start\n{failure}')
+
+            run_command(command, sessions, arrays)
+            pipe.send(command)
+        except Exception:
+            # tracebacks do not pickle, they are sent as text
+            pipe.send(RuntimeError(f'worker failed on {command!r}\n{traceback.format_exc()}'))
+
+        if command == 'close':
+            break
+
+    # views have to be released before the blocks can be closed
+    del arrays
+
+    for block in blocks.values():
+        block.close()
+
+
+def run_command(command, sessions, arrays):
+    """Step or reset sessions, writing results to shared memory."""
+    if command == 'step':
+        for i, session in sessions.items():
+            session.step(arrays['actions'][i])
+
+            arrays['rewards'][i] = session.rewards()
+            arrays['dones'][i] = session.done
+
+            # finished episodes start over, observation is of the new episode
+            if arrays['dones'][i]:
+                session.reset()
+
+            session.observe(out=arrays['observations'][i])
+
+            if 'grids' in arrays:
+                session.observe_grid(out=arrays['grids'][i])
+    elif command == 'reset':
+        for i, session in sessions.items():
+            session.reset()
+            session.observe(out=arrays['observations'][i])
+
+            if 'grids' in arrays:
+                session.observe_grid(out=arrays['grids'][i])
+
+
+class VecEnv:
+    """Batch of headless game sessions stepped together by worker processes."""
+    def __init__(self, n_envs, map_fname, cfg=None, n_workers=None, seed=None, grids=False):
+        """Allocate shared buffers and spread sessions evenly over workers, with tile grids if set."""
+        self.n_envs = n_envs
+        self.n_workers = min(n_workers or os.cpu_count(), n_envs)
+
+        # shared buffers, workers write results in place
+        specs = buffer_specs(n_envs, cfg, grid=grid_shape(map_fname, cfg) if grids else None)
+
+        self.blocks = {key: SharedMemory(create=True, size=max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1))
+                       for key, (shape, dtype) in specs.items()}
+        self.arrays = {key: np.ndarray(shape, dtype=dtype, buffer=self.blocks[key].buf)
+                       for key, (shape, dtype) in specs.items()}
+
+        names = {key: block.name for key, block in self.blocks.items()}
+
+        # one session seed per environment
+        seeds = np.random.SeedSequence(seed).generate_state(n_envs).tolist()
+
+        # start workers, each owns a contiguous slice of sessions
+        self.pipes = []
+        self.processes = []
+
+        for envs in np.array_split(np.arange(n_envs), self.n_workers):
+            pipe, worker_pipe = mp.Pipe()
+            process = mp.Process(target=worker,
+                                 args=(worker_pipe, names, specs, envs.tolist(), seeds[envs[0]:envs[-1] + 1],
+                                       map_fname, cfg),
+                                 daemon=True)
+            process.start()
+
+            # the parent keeps no worker end, so a dead worker ends its pipe instead of blocking
+            worker_pipe.close()
+
+            self.pipes.append(pipe)
+            self.processes.append(process)
+
+
+    def send(self, command):
+        """Send a command to all workers and wait until they are done, raises the first worker error."""
+        # workers that exited end their pipe, every other worker answers before raising
+        results = []
+        for pipe in self.pipes:
+            try:
+                pipe.send(command)
+                results.append(None)
+            except OSError as error:
+                results.append(error)
+
+        errors = []
+        for pipe, process, result in zip(self.pipes, self.processes, results):
+            if result is None:
+                try:
+                    result = pipe.recv()
+                except EOFError as error:
+                    result = error
+
+            if isinstance(result, OSError | EOFError):
+                process.join()
+                result = RuntimeError(f'worker {process.pid} exited with code {process.exitcode}')
+
+            if isinstance(result, Exception):
+                errors.append(result)
+
+        if errors:
+            raise errors[0]
+
+
+    def reset(self):
+        """Reset all sessions, returns the stacked observations."""
+        self.send('reset')
+
+        return self.arrays['observations']
+
+
+    def step(self, actions):
+        """Step all sessions, returns shared observation, reward and done buffers."""
+        self.arrays['actions'][:] = actions
+        self.send('step')
+
+        return self.arrays['observations'], self.arrays['rewards'], self.arrays['dones']
+
+
+    def close(self):
+        """Stop workers and free the shared buffers, also after a worker error."""
+        try:
+            self.send('close')
+        finally:
+            for process in self.processes:
+                process.join()
+
+            del self.arrays
+
+            for block in self.blocks.values():
+                block.close()
+                block.unlink()